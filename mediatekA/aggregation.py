@@ -0,0 +1,128 @@
+from bisect import bisect_left, insort
+
+from track_store import NUMERIC_FIELDS, StoreListener, TrackStore, changed_rows
+
+# Сводные отчеты: группировка по полю и статистика числового поля,
+# например суммарные прослушивания по исполнителям или средняя длительность по альбомам
+GROUP_FIELDS = ('artist', 'album', 'year')
+VALUE_FIELDS = tuple(NUMERIC_FIELDS)
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+
+def _check_fields(group_field, value_field):
+    if group_field not in GROUP_FIELDS:
+        raise ValueError(f"Группировка возможна по полям: {', '.join(GROUP_FIELDS)}")
+    if value_field not in VALUE_FIELDS:
+        raise ValueError(f"Статистика считается по полям: {', '.join(VALUE_FIELDS)}")
+
+
+def _group_stats(total, values):
+    """Статистика группы по сумме и отсортированному списку значений"""
+    count = len(values)
+    return {'count': count, 'sum': total, 'mean': total / count,
+            'min': values[0], 'max': values[-1]}
+
+
+class Rollup(StoreListener):
+    """
+    Сводка по группам, обновляемая при каждом изменении хранилища.
+    Для группы хранятся сумма и отсортированный список значений (минимум
+    и максимум остаются верными и после удалений), поэтому запрос сводки
+    стоит O(число групп), а изменение записи - двоичный поиск в ее группе.
+    """
+
+    def __init__(self, store, group_field, value_field):
+        _check_fields(group_field, value_field)
+        self.group_field = group_field
+        self.value_field = value_field
+        self.groups = {}
+        for group, value in zip(store.column(group_field), store.column(value_field)):
+            entry = self.groups.get(group)
+            if entry is None:
+                self.groups[group] = [value, [value]]
+            else:
+                entry[0] += value
+                entry[1].append(value)
+        for entry in self.groups.values():
+            entry[1].sort()
+
+    def _add(self, group, value):
+        entry = self.groups.get(group)
+        if entry is None:
+            self.groups[group] = [value, [value]]
+        else:
+            entry[0] += value
+            insort(entry[1], value)
+
+    def _remove(self, group, value):
+        entry = self.groups[group]
+        values = entry[1]
+        del values[bisect_left(values, value)]
+        if values:
+            entry[0] -= value
+        else:
+            del self.groups[group]
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            self._add(store.get_value(row_id, self.group_field),
+                      store.get_value(row_id, self.value_field))
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            self._remove(store.get_value(row_id, self.group_field),
+                         store.get_value(row_id, self.value_field))
+
+    def rows_changed(self, store, changes):
+        fields = (self.group_field, self.value_field)
+        changes = [change for change in changes if change[1] in fields]
+        for _, old_track, new_track in changed_rows(store, changes):
+            self._remove(old_track[self.group_field], old_track[self.value_field])
+            self._add(new_track[self.group_field], new_track[self.value_field])
+
+    def stats(self, group):
+        """Статистика одной группы или None, если группы нет"""
+        entry = self.groups.get(group)
+        return None if entry is None else _group_stats(*entry)
+
+    def results(self):
+        """Статистика всех групп: словарь группа -> {count, sum, mean, min, max}"""
+        return {group: _group_stats(total, values)
+                for group, (total, values) in self.groups.items()}
+
+
+def rollup(store, group_field, value_field):
+    """Сводка хранилища (строится при первом обращении, затем обновляется)"""
+    _check_fields(group_field, value_field)
+    return store.get_derived(f'rollup:{group_field}:{value_field}',
+                             lambda s: Rollup(s, group_field, value_field))
+
+
+def aggregate(tracks, group_field, value_field):
+    """
+    Группировка записей по полю group_field со статистикой поля value_field.
+    Для хранилища используется поддерживаемая сводка, для списка записей
+    статистика считается одним проходом.
+    Возвращает словарь группа -> {count, sum, mean, min, max}.
+    """
+    if isinstance(tracks, TrackStore):
+        return rollup(tracks, group_field, value_field).results()
+
+    _check_fields(group_field, value_field)
+    groups = {}
+    for track in tracks:
+        group = track[group_field]
+        value = track[value_field]
+        entry = groups.get(group)
+        if entry is None:
+            groups[group] = [1, value, value, value]
+        else:
+            entry[0] += 1
+            entry[1] += value
+            if value < entry[2]:
+                entry[2] = value
+            elif value > entry[3]:
+                entry[3] = value
+    return {group: {'count': count, 'sum': total, 'mean': total / count,
+                    'min': low, 'max': high}
+            for group, (count, total, low, high) in groups.items()}
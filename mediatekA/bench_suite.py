@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from generator import ORDERS, YEAR_MAX, YEAR_MIN, write_generated_library
+from loader import load_tracks_from_file, save_tracks_to_file
+from media_logic import (REPORT_ALL_SORT_SPECS, check_report_views, report_all_sorted,
+                         report_by_artist, report_by_year_range, sort_by_multiple_keys)
+from search import search_index
+from sorting import FieldKey, quicksort
+
+# Воспроизводимый набор замеров на синтетической медиатеке, например:
+#   python bench_suite.py --sizes 1000 10000 100000 1000000 --output results.json
+#   python bench_suite.py --sizes 100000 --duplicates 0.5 --order sorted --compare results.json
+# Для каждого размера замеряются загрузка, три отчета, сортировки, сохранение
+# и изменения; результаты (время и пиковая память) сохраняются в JSON.
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+QUICKSORT_MAX = 100000  # прежняя рекурсивная quicksort со списками - только до этого размера
+CHECK_MAX = 100000  # сверка индексов с построенными заново - только до этого размера
+MUTATIONS = 1000
+
+
+def measure(func, track_memory=True):
+    """
+    Время выполнения func() и пиковая память по tracemalloc (отдельным
+    повторным запуском, чтобы трассировка не искажала время).
+    Возвращает (результат, секунды, пик в байтах или None).
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    if not track_memory:
+        return result, elapsed, None
+    del result
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _cold(tracks, func):
+    """func без готовых индексов и представлений: каждый запуск строит их заново"""
+    def run():
+        tracks.reset_derived()
+        return func()
+    return run
+
+
+def _mutations(tracks, count):
+    """Добавление, изменение и удаление count записей (представления отчетов обновляются)"""
+    def run():
+        first = len(tracks)
+        for i in range(count):
+            tracks.append({'artist': f"Bench {i % 50:02d}", 'title': f"Bench Track {i}",
+                           'album': "Bench Album", 'year': YEAR_MIN + i % (YEAR_MAX - YEAR_MIN),
+                           'duration': 180, 'plays': i * 1000})
+        for i in range(count):
+            tracks[first + i]['plays'] = i
+        for _ in range(count):
+            tracks.pop(first)
+    return run
+
+
+def check_batch_update(tracks, count=10):
+    """
+    Пакет set_values, изменяющий одно поле записи дважды (как update_where
+    при повторном изменении), затем возврат исходных значений. После каждого
+    пакета индексы, поиск и представления отчетов сверяются с построенными
+    заново; при расхождении - RuntimeError.
+    """
+    search_index(tracks)
+    row_ids = list(tracks.row_ids[:count])
+    fields = ('artist', 'title', 'year')
+    originals = [(row_id, field, tracks.get_value(row_id, field))
+                 for row_id in row_ids for field in fields]
+    updates = []
+    for row_id in row_ids:
+        updates += [(row_id, 'artist', "Check Artist"), (row_id, 'artist', f"Check Artist {row_id}"),
+                    (row_id, 'title', "Check Title"), (row_id, 'title', f"Check Title {row_id}"),
+                    (row_id, 'year', YEAR_MIN), (row_id, 'year', YEAR_MAX)]
+    for batch in (updates, originals):
+        tracks.set_values(batch)
+        problems = check_report_views(tracks)
+        if problems:
+            raise RuntimeError(f"Индексы расходятся с данными после пакета изменений: {problems}")
+
+
+def bench_size(size, options, workdir, track_memory=True):
+    """Замеры всех этапов для медиатеки из size записей; возвращает список результатов"""
+    results = []
+
+    def record(phase, func, memory=track_memory):
+        result, seconds, peak = measure(func, memory)
+        results.append({'size': size, 'phase': phase, 'seconds': round(seconds, 6),
+                        'peak_bytes': peak})
+        print(f"{size:>10} | {phase:28} | {seconds:9.3f} | "
+              f"{'' if peak is None else f'{peak / 2 ** 20:10.1f}'}", file=sys.stderr)
+        return result
+
+    filename = os.path.join(workdir, f"library_{size}.txt")
+    record('generate', lambda: write_generated_library(filename, size, **options), False)
+    tracks = record('load', lambda: load_tracks_from_file(filename))
+    middle_year = (YEAR_MIN + YEAR_MAX) // 2
+
+    # Отчеты с построением представлений и по уже построенным представлениям
+    reports = (
+        ('report_all', lambda: report_all_sorted(tracks)),
+        ('report_artist', lambda: report_by_artist(tracks, "Artist 0000")),
+        ('report_years', lambda: report_by_year_range(tracks, middle_year - 5, middle_year + 5)),
+    )
+    for phase, report in reports:
+        record(phase, _cold(tracks, report))
+        record(f'{phase} (view)', report)
+    record('report_all top 100', lambda: sort_by_multiple_keys(tracks, REPORT_ALL_SORT_SPECS,
+                                                                limit=100))
+    record('sort_by_multiple_keys', lambda: sort_by_multiple_keys(tracks, REPORT_ALL_SORT_SPECS))
+    if size <= QUICKSORT_MAX:
+        rows = list(tracks)
+        record('quicksort (plays)', lambda: quicksort(rows, FieldKey('plays'), True))
+
+    saved = os.path.join(workdir, f"saved_{size}.txt")
+    record('save', lambda: save_tracks_to_file(saved, tracks))
+    count = min(MUTATIONS, size)
+    # Изменения при построенных представлениях: каждое обновляет индексы и представления
+    record(f'mutations x{count}', _mutations(tracks, count), False)
+    if size <= CHECK_MAX:
+        check_batch_update(tracks)
+    for name in (filename, saved):
+        os.remove(name)
+    return results
+
+
+def run_suite(sizes, options, track_memory=True):
+    """Полный набор замеров; возвращает документ с параметрами и результатами"""
+    print(f"{'Записей':>10} | {'Этап':28} | {'Время, с':>9} | {'Пик, МБ':>10}", file=sys.stderr)
+    print("-" * 66, file=sys.stderr)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # Сообщения загрузчика не нужны в выводе замеров
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+            for size in sizes:
+                results.extend(bench_size(size, options, workdir, track_memory))
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'options': options,
+            'track_memory': track_memory,
+        },
+        'results': results,
+    }
+
+
+def compare_results(previous, current):
+    """Сравнение с прежними результатами: отношение времени по каждому этапу"""
+    old = {(item['size'], item['phase']): item for item in previous['results']}
+    print(f"\n{'Записей':>10} | {'Этап':28} | {'Было, с':>9} | {'Стало, с':>9} | {'Отношение':>9}")
+    print("-" * 78)
+    for item in current['results']:
+        before = old.get((item['size'], item['phase']))
+        if before is None or not before['seconds']:
+            continue
+        ratio = item['seconds'] / before['seconds']
+        print(f"{item['size']:>10} | {item['phase']:28} | {before['seconds']:9.3f} | "
+              f"{item['seconds']:9.3f} | {ratio:8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности медиатеки")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Размеры медиатеки (например, 1000 ... 10000000)")
+    parser.add_argument('--artists', type=int, default=200, help="Число различных исполнителей")
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help="Доля записей с повторяющимися ключами сортировки (0-1)")
+    parser.add_argument('--year-skew', type=float, default=0.0,
+                        help="Смещение годов к последним (0 - равномерно)")
+    parser.add_argument('--order', choices=ORDERS, default='random',
+                        help="Порядок записей в файле относительно отчета 1")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Не замерять пиковую память (вдвое быстрее)")
+    parser.add_argument('--output', help="Файл JSON для результатов")
+    parser.add_argument('--compare', help="Файл JSON с прежними результатами для сравнения")
+    args = parser.parse_args(argv)
+
+    options = {'artists': args.artists, 'duplicate_ratio': args.duplicates,
+               'year_skew': args.year_skew, 'order': args.order, 'seed': args.seed}
+    sys.setrecursionlimit(10000)
+    document = run_suite(args.sizes, options, not args.no_memory)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(document, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare_results(json.load(file), document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from generator import generate_tracks, write_generated_library
+from loader import display_track, load_tracks_from_file, render_tracks_table
+from snapshot import open_snapshot, write_snapshot
+from media_logic import (report_all_sorted, report_by_artist, report_by_year_range,
+                         sort_by_multiple_keys)
+from numpy_engine import numpy_available
+from sorting import quicksort
+from track_store import TrackStore
+
+
+def sort_by_multiple_keys_multipass(tracks, sort_specs):
+    """Прежняя реализация: отдельный проход quicksort для каждого ключа (эталон)"""
+    if not tracks:
+        return []
+
+    sorted_tracks = tracks.copy()
+    for key_func, reverse in reversed(sort_specs):
+        sorted_tracks = quicksort(sorted_tracks, key_func, reverse)
+
+    return sorted_tracks
+
+
+REPORT_SPECS = {
+    'Отчет 1': [
+        (lambda x: x['plays'], True),
+        (lambda x: x['year'], True),
+        (lambda x: x['artist'].lower(), False)
+    ],
+    'Отчет 2': [
+        (lambda x: x['title'].lower(), False),
+        (lambda x: x['album'].lower(), True)
+    ],
+    'Отчет 3': [
+        (lambda x: x['artist'].lower(), False),
+        (lambda x: x['year'], True)
+    ],
+}
+
+
+def timed(func, *args):
+    """Замер времени выполнения функции"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_sort_engines(sizes):
+    """Сравнение многопроходной и однопроходной сортировки по составному ключу"""
+    print(f"{'Отчет':8} | {'Записей':>9} | {'Многопроход, с':>14} | "
+          f"{'Составной ключ, с':>17} | {'Ускорение':>9} | Совпадает")
+    print("-" * 80)
+    for size in sizes:
+        tracks = generate_tracks(size)
+        for name, specs in REPORT_SPECS.items():
+            expected, old_time = timed(sort_by_multiple_keys_multipass, tracks, specs)
+            actual, new_time = timed(sort_by_multiple_keys, tracks, specs)
+            same = all(a is b for a, b in zip(expected, actual)) and len(expected) == len(actual)
+            print(f"{name:8} | {size:9} | {old_time:14.3f} | {new_time:17.3f} | "
+                  f"{old_time / new_time:8.1f}x | {'да' if same else 'НЕТ'}")
+
+
+def bench_sort_algorithms(sizes):
+    """Сравнение времени и пиковой памяти рекурсивной и интроспективной сортировки"""
+    print(f"\n{'Алгоритм':10} | {'Записей':>9} | {'Время, с':>9} | {'Пик памяти, МБ':>14}")
+    print("-" * 52)
+    specs = REPORT_SPECS['Отчет 1']
+    for size in sizes:
+        tracks = generate_tracks(size)
+        for algorithm in ('hoare', 'introsort'):
+            _, elapsed = timed(sort_by_multiple_keys, tracks, specs, algorithm)
+            tracemalloc.start()
+            sort_by_multiple_keys(tracks, specs, algorithm)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{algorithm:10} | {size:9} | {elapsed:9.3f} | {peak / 2 ** 20:14.1f}")
+
+
+def bench_top_k(sizes, limits=(10, 100, 1000)):
+    """Первая страница отчета: частичный выбор против полной сортировки"""
+    print(f"\n{'Записей':>9} | {'Страница':>8} | {'Полная, с':>9} | {'Частичный, с':>12} | Совпадает")
+    print("-" * 62)
+    specs = REPORT_SPECS['Отчет 1']
+    for size in sizes:
+        tracks = generate_tracks(size)
+        for limit in limits:
+            expected, full_time = timed(lambda: sort_by_multiple_keys(tracks, specs)[:limit])
+            actual, top_time = timed(sort_by_multiple_keys, tracks, specs, 'introsort', limit)
+            same = len(expected) == len(actual) and all(a is b for a, b in zip(expected, actual))
+            print(f"{size:9} | {limit:8} | {full_time:9.3f} | {top_time:12.3f} | "
+                  f"{'да' if same else 'НЕТ'}")
+
+
+def bench_parallel_sort(sizes, workers_list=(1, 2, 4, 8)):
+    """
+    Полная сортировка отчета 1 в пуле процессов против одного процесса.
+    Ускорение ограничено последовательными этапами: вычислением упакованных
+    ключей, передачей частей процессам и слиянием.
+    """
+    print(f"\n{'Записей':>9} | {'Процессов':>9} | {'Время, с':>9} | {'Ускорение':>9} | Совпадает")
+    print("-" * 58)
+    specs = REPORT_SPECS['Отчет 1']
+    for size in sizes:
+        tracks = generate_tracks(size)
+        expected, sequential_time = timed(sort_by_multiple_keys, tracks, specs)
+        for workers in workers_list:
+            actual, elapsed = timed(lambda: sort_by_multiple_keys(tracks, specs, workers=workers))
+            same = len(expected) == len(actual) and all(a is b for a, b in zip(expected, actual))
+            print(f"{size:9} | {workers:9} | {elapsed:9.3f} | {sequential_time / elapsed:8.2f}x | "
+                  f"{'да' if same else 'НЕТ'}")
+
+
+def bench_numpy_engine(sizes):
+    """
+    Три отчета движками 'python' и 'numpy' на новом хранилище
+    (в том числе построение представлений или колонок NumPy).
+    """
+    if not numpy_available():
+        print("\nДвижок numpy: пакет numpy не установлен, сравнение пропущено")
+        return
+    print(f"\n{'Отчет':8} | {'Записей':>9} | {'python, с':>9} | {'numpy, с':>9} | "
+          f"{'Ускорение':>9} | Совпадает")
+    print("-" * 66)
+    reports = {
+        'Отчет 1': lambda tracks, backend: report_all_sorted(tracks, backend=backend),
+        'Отчет 2': lambda tracks, backend: report_by_artist(tracks, 'Artist 0007', backend=backend),
+        'Отчет 3': lambda tracks, backend: report_by_year_range(tracks, 1990, 2005,
+                                                               backend=backend),
+    }
+    for size in sizes:
+        tracks = generate_tracks(size)
+        for name, report in reports.items():
+            expected, python_time = timed(report, TrackStore(tracks), 'python')
+            actual, numpy_time = timed(report, TrackStore(tracks), 'numpy')
+            same = list(expected.iter_values()) == list(actual.iter_values())
+            print(f"{name:8} | {size:9} | {python_time:9.3f} | {numpy_time:9.3f} | "
+                  f"{python_time / numpy_time:8.1f}x | {'да' if same else 'НЕТ'}")
+
+
+def bench_store_memory(sizes):
+    """Сравнение памяти списка словарей и колоночного хранилища"""
+    print(f"\n{'Хранение':16} | {'Записей':>9} | {'Байт на запись':>14}")
+    print("-" * 46)
+    for size in sizes:
+        for name, build in (('список словарей', lambda: generate_tracks(size)),
+                             ('TrackStore', lambda: TrackStore(generate_tracks(size)))):
+            tracemalloc.start()
+            tracks = build()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:16} | {size:9} | {current / size:14.0f}")
+            del tracks
+
+
+def bench_parallel_load(sizes, workers_list=(2, 4, 8)):
+    """Время последовательной и параллельной загрузки файла"""
+    print(f"\n{'Загрузка':16} | {'Записей':>9} | {'Время, с':>9} | {'Записей/с':>10}")
+    print("-" * 54)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            filename = os.path.join(directory, f"tracks_{size}.txt")
+            write_generated_library(filename, size)
+            _, elapsed = timed(load_tracks_from_file, filename)
+            print(f"{'последовательно':16} | {size:9} | {elapsed:9.3f} | {size / elapsed:10.0f}")
+            for workers in workers_list:
+                _, elapsed = timed(lambda: load_tracks_from_file(filename, workers=workers))
+                print(f"{f'{workers} процесс(ов)':16} | {size:9} | {elapsed:9.3f} | "
+                      f"{size / elapsed:10.0f}")
+
+
+def bench_snapshot(sizes):
+    """Время загрузки текстового файла и открытия бинарного снимка"""
+    print(f"\n{'Формат':16} | {'Записей':>9} | {'Открытие, с':>11} | {'Отчет 1, с':>10}")
+    print("-" * 56)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            text_name = os.path.join(directory, f"tracks_{size}.txt")
+            snapshot_name = os.path.join(directory, f"tracks_{size}.mtks")
+            tracks = generate_tracks(size)
+            write_generated_library(text_name, size)  # те же записи, что в tracks
+            write_snapshot(snapshot_name, tracks)
+            for name, opener, filename in (('текст', load_tracks_from_file, text_name),
+                                           ('снимок (mmap)', open_snapshot, snapshot_name)):
+                store, elapsed = timed(opener, filename)
+                _, report_time = timed(sort_by_multiple_keys, store, REPORT_SPECS['Отчет 1'])
+                print(f"{name:16} | {size:9} | {elapsed:11.4f} | {report_time:10.3f}")
+
+
+def bench_render(sizes):
+    """Вывод отчета построчно через print и буферизованным выводом таблицы"""
+    print(f"\n{'Вывод':16} | {'Записей':>9} | {'Время, с':>9}")
+    print("-" * 40)
+    for size in sizes:
+        tracks = TrackStore(generate_tracks(size))
+        with open(os.devnull, 'w', encoding='utf-8') as out:
+            def print_rows():
+                for i, track in enumerate(tracks, 1):
+                    print(display_track(track, i), file=out)
+
+            _, elapsed = timed(print_rows)
+            print(f"{'print по строке':16} | {size:9} | {elapsed:9.3f}")
+            _, elapsed = timed(render_tracks_table, tracks, None, True, 0, None, out)
+            print(f"{'пачками':16} | {size:9} | {elapsed:9.3f}")
+
+
+def bench_startup(sizes):
+    """
+    Время от запуска main.py до появления меню и до окончания загрузки
+    (выход из меню дожидается загрузки медиатеки)
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    print(f"\n{'Записей':>9} | {'До меню, с':>10} | {'Загрузка, с':>11}")
+    print("-" * 37)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            write_generated_library(os.path.join(directory, 'tracks_data.txt'), size)
+            for name in os.listdir(directory):
+                if name.endswith('.journal'):
+                    os.remove(os.path.join(directory, name))
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, script], cwd=directory, text=True,
+                                       encoding='utf-8', stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE)
+            output = ''
+            while 'Выберите действие' not in output:
+                char = process.stdout.read(1)
+                if not char:
+                    break  # процесс завершился до меню
+                output += char
+            menu_time = time.perf_counter() - start
+            process.communicate("9\nнет\n")
+            total_time = time.perf_counter() - start
+            print(f"{size:9} | {menu_time:10.3f} | {total_time:11.3f}")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    sys.setrecursionlimit(10000)
+    bench_sort_engines(sizes)
+    bench_sort_algorithms(sizes)
+    bench_top_k(sizes)
+    bench_parallel_sort(sizes)
+    bench_numpy_engine(sizes)
+    bench_store_memory(sizes)
+    bench_parallel_load(sizes)
+    bench_snapshot(sizes)
+    bench_render(sizes)
+    bench_startup(sizes)
+
+
+if __name__ == "__main__":
+    main()
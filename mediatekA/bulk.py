@@ -0,0 +1,74 @@
+from track_store import FIELDS, TrackStore
+from validation import describe_errors, validate_tracks
+
+# Пакетные изменения медиатеки для скриптов и импорта:
+#   add_many(tracks, new_tracks)
+#   delete_where(tracks, lambda track: track['plays'] == 0)
+#   update_where(tracks, lambda track: track['artist'] == 'Queen',
+#                {'plays': lambda track: track['plays'] + 1})
+# Пакет проверяется целиком до изменения: при ошибке не меняется ничего.
+# Хранилище получает одно изменение на пакет, поэтому индексы и представления
+# обновляются один раз (большой пакет - перестроением), а не по записи.
+
+
+def _check(records):
+    errors = validate_tracks(records)
+    if errors:
+        raise ValueError("Некорректные данные в пакете:\n" + describe_errors(errors))
+
+
+def _matching(tracks, predicate):
+    """Пары (row_id или позиция, запись-словарь), удовлетворяющие условию"""
+    if isinstance(tracks, TrackStore):
+        records = zip(tracks.row_ids, (dict(zip(FIELDS, values)) for values in tracks.iter_values()))
+    else:
+        records = enumerate(tracks)
+    return [(key, track) for key, track in records if predicate(track)]
+
+
+def add_many(tracks, new_tracks):
+    """Добавление пакета записей после проверки всего пакета; возвращает число добавленных"""
+    records = [{field: track.get(field) for field in FIELDS} for track in new_tracks]
+    _check(records)
+    tracks.extend(records)
+    return len(records)
+
+
+def delete_where(tracks, predicate):
+    """Удаление всех записей, для которых predicate(запись) истинно; возвращает их число"""
+    if isinstance(tracks, TrackStore):
+        return tracks.remove_rows(row_id for row_id, _ in _matching(tracks, predicate))
+    kept = [track for track in tracks if not predicate(track)]
+    removed = len(tracks) - len(kept)
+    tracks[:] = kept
+    return removed
+
+
+def update_where(tracks, predicate, changes):
+    """
+    Изменение полей записей, для которых predicate(запись) истинно.
+    changes - словарь поле -> новое значение или функция от записи,
+    возвращающая новое значение. Возвращает число измененных записей.
+    """
+    for field in changes:
+        if field not in FIELDS:
+            raise KeyError(field)
+    matched = _matching(tracks, predicate)
+    updated = []
+    for _, track in matched:
+        new_track = dict(track)
+        for field, value in changes.items():
+            new_track[field] = value(track) if callable(value) else value
+        updated.append(new_track)
+    _check(updated)
+    changed = sum(any(track[field] != new_track[field] for field in changes)
+                  for (_, track), new_track in zip(matched, updated))
+
+    if isinstance(tracks, TrackStore):
+        tracks.set_values((row_id, field, new_track[field])
+                          for (row_id, _), new_track in zip(matched, updated)
+                          for field in changes)
+    else:
+        for (position, _), new_track in zip(matched, updated):
+            tracks[position].update((field, new_track[field]) for field in changes)
+    return changed
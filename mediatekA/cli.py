@@ -0,0 +1,414 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from itertools import islice
+
+from aggregation import AGGREGATES, GROUP_FIELDS, VALUE_FIELDS, aggregate
+from dedup import MERGE_POLICIES, merge_tracks
+from journal import load_with_journal
+from loader import iter_tracks, render_tracks_table, write_tracks_csv, write_tracks_jsonl
+from media_logic import (BACKENDS, report_all_sorted, report_all_sorted_external, report_by_artist,
+                         report_by_artist_stream, report_by_year_range,
+                         report_by_year_range_external)
+from profiling import profiling
+from search import SEARCH_MODES, search_tracks
+from track_store import FIELDS, NUMERIC_FIELDS
+from validation import validate_track_data
+
+# Пакетный режим без диалога, например:
+#   python cli.py report --all --artist Queen --artist ABBA --years 1970-1979 --format csv
+#   python cli.py apply changes.jsonl --save --years 2020-2026 --format jsonl
+#   python cli.py report --aggregate artist:plays --aggregate year:duration
+#   python cli.py report --search "ed shee" --search-mode prefix --limit 20
+#   python cli.py merge partner_catalog.txt --policy keep_max_plays --save
+#   python cli.py report --external --memory-limit 512 --all --format csv --output report.csv
+#   python cli.py --workers 4 report --all --limit 100
+# Медиатека загружается один раз, все запросы выполняются над ней.
+# Служебные сообщения выводятся в stderr, результат - в stdout или --output.
+
+OUTPUT_FORMATS = ('table', 'csv', 'jsonl')
+
+
+def parse_year_range(text):
+    """Диапазон лет 'N1-N2' или один год 'N'"""
+    start, _, end = text.partition('-')
+    try:
+        start_year = int(start)
+        end_year = int(end) if end else start_year
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"некорректный диапазон лет: {text}")
+    return min(start_year, end_year), max(start_year, end_year)
+
+
+def non_negative_int(text):
+    """Неотрицательное целое число (--limit, --offset)"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается целое число: {text}") from None
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"ожидается неотрицательное число: {text}")
+    return value
+
+
+def parse_aggregate(text):
+    """Сводка 'ГРУППА:ПОЛЕ', например artist:plays"""
+    group_field, _, value_field = text.partition(':')
+    if group_field not in GROUP_FIELDS or value_field not in VALUE_FIELDS:
+        raise argparse.ArgumentTypeError(
+            f"некорректная сводка: {text} (группа: {', '.join(GROUP_FIELDS)}; "
+            f"поле: {', '.join(VALUE_FIELDS)})")
+    return group_field, value_field
+
+
+def build_parser():
+    """Разбор аргументов командной строки"""
+    reports = argparse.ArgumentParser(add_help=False)
+    group = reports.add_argument_group('отчеты')
+    group.add_argument('--all', action='store_true', help="Отчет 1: полный отсортированный список")
+    group.add_argument('--artist', action='append', nargs='+', default=[], metavar='ИМЯ',
+                       help="Отчет 2 по исполнителю (можно указать несколько)")
+    group.add_argument('--years', action='append', nargs='+', default=[], type=parse_year_range,
+                       metavar='N1-N2', help="Отчет 3 по диапазону лет (можно указать несколько)")
+    group.add_argument('--search', action='append', default=[], metavar='ЗАПРОС',
+                       help="Поиск по словам исполнителя, названия и альбома "
+                            "(по убыванию прослушиваний)")
+    group.add_argument('--search-mode', choices=SEARCH_MODES, default='prefix',
+                       help="Совпадение слова: целиком, по началу или по части (по умолчанию prefix)")
+    group.add_argument('--aggregate', action='append', default=[], type=parse_aggregate,
+                       metavar='ГРУППА:ПОЛЕ',
+                       help="Сводка по группам: count, sum, mean, min, max (например, artist:plays); "
+                            "в формате csv выводится без отчетов")
+    group.add_argument('--limit', type=non_negative_int, default=None,
+                       help="Число записей в каждом отчете")
+    group.add_argument('--offset', type=non_negative_int, default=0,
+                       help="Пропустить первые записи отчета")
+    group.add_argument('--backend', choices=BACKENDS, default='python',
+                       help="Движок отчетов (numpy требует установленного пакета numpy)")
+    group.add_argument('--format', choices=OUTPUT_FORMATS, default='table',
+                       help="Формат вывода (по умолчанию table)")
+    group.add_argument('--output', default=None, help="Файл результата (по умолчанию stdout)")
+
+    # Внешняя сортировка читает файл медиатеки и не видит изменений apply/merge,
+    # поэтому ее параметры есть только у команды report
+    external = argparse.ArgumentParser(add_help=False)
+    group = external.add_argument_group('внешняя сортировка')
+    group.add_argument('--external', action='store_true',
+                       help="Отчеты 1-3 потоком по файлу без загрузки медиатеки "
+                            "(внешняя сортировка через временные файлы)")
+    group.add_argument('--memory-limit', type=int, default=256, metavar='МБ',
+                       help="Память для внешней сортировки (по умолчанию 256 МБ)")
+
+    parser = argparse.ArgumentParser(description="Медиатека: пакетные отчеты и изменения")
+    parser.add_argument('--data', default='tracks_data.txt', help="Файл медиатеки")
+    parser.add_argument('--workers', type=non_negative_int, default=1, metavar='N',
+                        help="Процессов разбора текстового файла медиатеки "
+                             "(0 - по числу ядер, по умолчанию 1)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Вывести в stderr сводку времени этапов и счетчиков")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('report', parents=[reports, external], help="Построить отчеты")
+    apply_parser = commands.add_parser(
+        'apply', parents=[reports],
+        help="Применить изменения из файла и (при --save) сохранить; затем построить отчеты")
+    apply_parser.add_argument('changes', help="Файл изменений: по объекту JSON в строке")
+    apply_parser.add_argument('--save', action='store_true', help="Сохранить изменения")
+    apply_parser.set_defaults(external=False)
+    merge_parser = commands.add_parser(
+        'merge', parents=[reports],
+        help="Объединить каталог (файл формата медиатеки) с медиатекой без повторов")
+    merge_parser.add_argument('catalog', help="Файл каталога")
+    merge_parser.add_argument('--policy', choices=MERGE_POLICIES, default='keep_max_plays',
+                              help="Что делать с повтором имеющейся записи (по умолчанию "
+                                   "keep_max_plays)")
+    merge_parser.add_argument('--save', action='store_true', help="Сохранить изменения")
+    merge_parser.set_defaults(external=False)
+    return parser
+
+
+def report_queries(args):
+    """Список запросов (метка, функция построения отчета) в порядке аргументов"""
+    queries = []
+    if args.all:
+        queries.append(('all', lambda tracks: report_all_sorted(
+            tracks, args.limit, args.offset, args.backend)))
+    for artist in (name for names in args.artist for name in names):
+        queries.append((f"artist:{artist}", lambda tracks, artist=artist: report_by_artist(
+            tracks, artist, args.limit, args.offset, args.backend)))
+    for start_year, end_year in (years for ranges in args.years for years in ranges):
+        queries.append((f"years:{start_year}-{end_year}",
+                        lambda tracks, start=start_year, end=end_year: report_by_year_range(
+                            tracks, start, end, args.limit, args.offset, args.backend)))
+    page_end = None if args.limit is None else args.offset + args.limit
+    for text in args.search:
+        queries.append((f"search:{text}", lambda tracks, text=text: list(search_tracks(
+            tracks, text, args.search_mode, limit=page_end))[args.offset:]))
+    return queries
+
+
+def external_queries(args):
+    """Запросы режима --external: каждый отчет заново читает файл медиатеки потоком"""
+    memory_limit = args.memory_limit * 1024 * 1024
+    stop = None if args.limit is None else args.offset + args.limit
+    queries = []
+    if args.all:
+        queries.append(('all', lambda _: islice(report_all_sorted_external(
+            iter_tracks(args.data), memory_limit), args.offset, stop)))
+    for artist in (name for names in args.artist for name in names):
+        queries.append((f"artist:{artist}", lambda _, artist=artist: report_by_artist_stream(
+            iter_tracks(args.data), artist)[args.offset:stop]))
+    for start_year, end_year in (years for ranges in args.years for years in ranges):
+        queries.append((f"years:{start_year}-{end_year}",
+                        lambda _, start=start_year, end=end_year: islice(
+                            report_by_year_range_external(iter_tracks(args.data), start, end,
+                                                          memory_limit), args.offset, stop)))
+    return queries
+
+
+def write_reports(tracks, queries, output_format, out):
+    """Построение и вывод отчетов; возвращает общее число выведенных записей"""
+    total = 0
+    for number, (query, build_report) in enumerate(queries):
+        report = build_report(tracks)
+        if output_format == 'csv':
+            total += write_tracks_csv(report, out, query, header=number == 0)
+        elif output_format == 'jsonl':
+            total += write_tracks_jsonl(report, out, query)
+        else:
+            total += render_tracks_table(report, f"ОТЧЕТ {query}", show_index=True, out=out)
+    return total
+
+
+def write_aggregates(tracks, aggregates, output_format, out):
+    """
+    Вывод сводок (группы по возрастанию); возвращает общее число выведенных групп.
+    В csv у всех сводок общий заголовок: поле группы указано в колонке query.
+    """
+    total = 0
+    for number, (group_field, value_field) in enumerate(aggregates):
+        query = f"aggregate:{group_field}:{value_field}"
+        groups = sorted(aggregate(tracks, group_field, value_field).items())
+        if output_format == 'csv':
+            writer = csv.writer(out)
+            if number == 0:
+                writer.writerow(('query', 'group') + AGGREGATES)
+            for group, stats in groups:
+                writer.writerow((query, group) + tuple(stats[name] for name in AGGREGATES))
+        elif output_format == 'jsonl':
+            for group, stats in groups:
+                out.write(json.dumps({'query': query, group_field: group, **stats},
+                                     ensure_ascii=False) + "\n")
+        else:
+            out.write(f"\nСВОДКА {value_field} ПО {group_field}\n")
+            out.write(f"{group_field:40} | {'count':>8} | {'sum':>15} | {'mean':>15} | "
+                      f"{'min':>12} | {'max':>12}\n")
+            out.write("-" * 117 + "\n")
+            for group, stats in groups:
+                out.write(f"{str(group)[:40]:40} | {stats['count']:8} | {stats['sum']:15} | "
+                          f"{stats['mean']:15.2f} | {stats['min']:12} | {stats['max']:12}\n")
+        total += len(groups)
+    return total
+
+
+def _track_fields(record, required):
+    """Проверенные значения полей из записи файла изменений"""
+    values = {}
+    for field in FIELDS:
+        if field not in record:
+            if required:
+                raise ValueError(f"нет поля {field}")
+            continue
+        value = record[field]
+        if field in NUMERIC_FIELDS:
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(f"некорректное значение поля {field}")
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"поле {field} должно быть целым числом: {value!r}") from None
+        elif not isinstance(value, str):
+            raise ValueError(f"некорректное значение поля {field}")
+        else:
+            value = value.strip()
+        values[field] = value
+    return values
+
+
+def _track_position(tracks, record):
+    """
+    Позиция записи (номер с 1, как в меню) в индекс списка.
+    Вместо позиции можно указать постоянный идентификатор записи "track_id".
+    """
+    if 'track_id' in record and hasattr(tracks, 'row_of'):
+        track_id = record['track_id']
+        try:
+            if isinstance(track_id, bool) or not isinstance(track_id, int):
+                raise KeyError(track_id)
+            return tracks.position_of(tracks.row_of(track_id))
+        except KeyError:
+            raise ValueError(f"нет записи с идентификатором {track_id}")
+    position = record.get('position')
+    if isinstance(position, bool) or not isinstance(position, int) \
+            or not 1 <= position <= len(tracks):
+        raise ValueError(f"номер записи должен быть от 1 до {len(tracks)}")
+    return position - 1
+
+
+def apply_change(tracks, record):
+    """
+    Применение одного изменения:
+    {"op": "add", "artist": ..., "title": ..., "album": ..., "year": ..., "duration": ..., "plays": ...}
+    {"op": "delete", "position": N} или {"op": "delete", "track_id": ID}
+    {"op": "edit", "position": N, <изменяемые поля>} (или "track_id" вместо "position")
+    Номера записей - текущие позиции с 1, изменения применяются по порядку.
+    """
+    operation = record.get('op')
+    if operation == 'add':
+        track = _track_fields(record, required=True)
+        errors = validate_track_data(*(track[field] for field in FIELDS))
+        if errors:
+            raise ValueError("; ".join(errors))
+        tracks.append(track)
+    elif operation == 'delete':
+        tracks.pop(_track_position(tracks, record))
+    elif operation == 'edit':
+        track = tracks[_track_position(tracks, record)]
+        changes = _track_fields(record, required=False)
+        errors = validate_track_data(*(changes.get(field, track[field]) for field in FIELDS))
+        if errors:
+            raise ValueError("; ".join(errors))
+        for field, value in changes.items():
+            track[field] = value
+    else:
+        raise ValueError(f"неизвестная операция: {operation}")
+
+
+def apply_changes_file(tracks, filename):
+    """
+    Применение файла изменений. Некорректные строки пропускаются с сообщением.
+    Возвращает (число примененных изменений, число ошибок).
+    """
+    applied = errors = 0
+    with open(filename, encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("ожидается объект JSON")
+                apply_change(tracks, record)
+                applied += 1
+            except ValueError as e:
+                print(f"Строка {line_number} файла изменений пропущена: {e}")
+                errors += 1
+    return applied, errors
+
+
+def run(args, out):
+    """Выполнение команды с выводом результата в out; возвращает код завершения"""
+    if args.command == 'report' and args.external:
+        return run_external(args, out)
+    queries = report_queries(args)
+    if args.format == 'csv' and queries and args.aggregate:
+        # У записей отчетов и у сводок разные колонки: один файл csv - одна схема
+        print("Формат csv: отчеты и сводки (--aggregate) выводятся отдельными запусками")
+        return 2
+    if args.backend == 'numpy':
+        # Проверка до загрузки медиатеки; движок импортируется только при выборе
+        from numpy_engine import numpy_available
+        if not numpy_available():
+            print("Ошибка: для движка 'numpy' требуется установить пакет numpy")
+            return 1
+    tracks, journal = load_with_journal(args.data, workers=args.workers or None)
+    if not tracks:
+        print(f"Невозможно загрузить данные! Проверьте файл {args.data}")
+        return 1
+
+    status = 0
+    try:
+        if args.command == 'apply':
+            try:
+                applied, errors = apply_changes_file(tracks, args.changes)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Ошибка при чтении файла изменений: {e}")
+                journal.discard_unsaved()
+                return 1
+            print(f"Применено изменений: {applied}, пропущено: {errors}")
+            if errors:
+                status = 1
+        elif args.command == 'merge':
+            try:
+                counts = merge_tracks(tracks, iter_tracks(args.catalog), args.policy)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Ошибка при чтении каталога: {e}")
+                journal.discard_unsaved()
+                return 1
+            print(f"Добавлено записей: {counts['added']}, объединено повторов: {counts['merged']}, "
+                  f"оставлено без изменений: {counts['kept']}")
+        if args.command in ('apply', 'merge'):
+            if args.save:
+                if not journal.save(tracks):
+                    return 1
+            else:
+                journal.discard_unsaved()
+
+        write_results(args, tracks, queries, out)
+    finally:
+        journal.close()
+    return status
+
+
+def write_results(args, tracks, queries, out):
+    """Вывод отчетов и сводок в out или в файл --output"""
+    if not queries and not args.aggregate:
+        return
+    file = out if args.output is None else open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        total = write_reports(tracks, queries, args.format, file)
+        groups = write_aggregates(tracks, args.aggregate, args.format, file)
+    finally:
+        if file is out:
+            out.flush()
+        else:
+            file.close()
+    if queries:
+        print(f"Выведено записей: {total}")
+    if args.aggregate:
+        print(f"Выведено групп: {groups}")
+
+
+def run_external(args, out):
+    """Команда report в режиме --external: медиатека не загружается в память"""
+    if args.search or args.aggregate or args.backend != 'python':
+        print("Поиск, сводки и движок numpy требуют загрузки медиатеки (без --external)")
+        return 2
+    if not os.path.exists(args.data):
+        print(f"Ошибка: файл {args.data} не найден!")
+        return 1
+    try:
+        write_results(args, None, external_queries(args), out)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Ошибка при чтении данных: {e}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    # Сообщения загрузки и сохранения не должны смешиваться с результатом в stdout
+    with redirect_stdout(sys.stderr):
+        if not args.profile:
+            return run(args, out)
+        with profiling() as profile:
+            status = run(args, out)
+        print(profile.summary())
+        return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
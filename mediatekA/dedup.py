@@ -0,0 +1,218 @@
+from track_store import FIELDS, StoreListener, TrackStore, changed_rows, collation_key
+
+# Повторы: записи с одинаковыми исполнителем, названием и альбомом без учета
+# регистра и лишних пробелов. Политики объединения повтора с имеющейся записью:
+#   keep_first     - оставить имеющуюся запись без изменений
+#   keep_max_plays - оставить запись с большим числом прослушиваний
+#   keep_latest    - заменить имеющуюся запись новой
+# Имеющаяся запись изменяется на месте, поэтому ее постоянный идентификатор
+# и позиция сохраняются.
+MERGE_POLICIES = ('keep_first', 'keep_max_plays', 'keep_latest')
+KEY_FIELDS = ('artist', 'title', 'album')
+MERGE_CHUNK = 100000  # новых записей в одном добавлении при слиянии
+
+
+def normalize_key_part(value):
+    """Часть ключа повтора: без учета регистра, пробелы по краям и повторные пробелы убраны"""
+    return ' '.join(collation_key(value).split())
+
+
+def track_key(artist, title, album):
+    """Ключ повтора записи"""
+    return normalize_key_part(artist), normalize_key_part(title), normalize_key_part(album)
+
+
+def _check_policy(policy):
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Неизвестная политика объединения: {policy}")
+
+
+def merged_values(policy, existing, new_track):
+    """
+    Изменения имеющейся записи existing при добавлении повтора new_track
+    по политике policy: словарь поле -> новое значение (пустой - без изменений).
+    """
+    if policy == 'keep_first' or policy == 'keep_max_plays' and new_track['plays'] <= existing['plays']:
+        return {}
+    return {field: new_track[field] for field in FIELDS if new_track[field] != existing[field]}
+
+
+class DedupIndex(StoreListener):
+    """
+    Хеш-индекс: ключ повтора -> номер строки записи (O(1) на проверку).
+    Если в хранилище уже есть повторы (загрузка без объединения), для ключа
+    хранится отсортированный список номеров строк, а первой считается
+    запись, добавленная раньше.
+    """
+
+    def __init__(self, store):
+        self.rows_by_key = {}
+        parts = {field: [normalize_key_part(string) for string in store.pools[field].strings]
+                 for field in KEY_FIELDS}
+        artists, titles, albums = (parts[field] for field in KEY_FIELDS)
+        columns = [store.columns[field] for field in KEY_FIELDS]
+        for row_id in store.row_ids:
+            self._add((artists[columns[0][row_id]], titles[columns[1][row_id]],
+                       albums[columns[2][row_id]]), row_id)
+
+    def find(self, key):
+        """Номер строки первой записи с ключом key или None"""
+        rows = self.rows_by_key.get(key)
+        if isinstance(rows, list):
+            return rows[0]
+        return rows
+
+    def _add(self, key, row_id):
+        rows = self.rows_by_key.get(key)
+        if rows is None:
+            self.rows_by_key[key] = row_id
+        elif isinstance(rows, list):
+            rows.append(row_id)
+            rows.sort()
+        else:
+            self.rows_by_key[key] = sorted((rows, row_id))
+
+    def _remove(self, key, row_id):
+        rows = self.rows_by_key.get(key)
+        if isinstance(rows, list):
+            rows.remove(row_id)
+            if len(rows) == 1:
+                self.rows_by_key[key] = rows[0]
+        elif rows == row_id:
+            del self.rows_by_key[key]
+
+    @staticmethod
+    def _key(store, row_id):
+        return track_key(*(store.get_value(row_id, field) for field in KEY_FIELDS))
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            self._add(self._key(store, row_id), row_id)
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            self._remove(self._key(store, row_id), row_id)
+
+    def rows_changed(self, store, changes):
+        changes = [change for change in changes if change[1] in KEY_FIELDS]
+        for row_id, old_track, new_track in changed_rows(store, changes):
+            old_key = track_key(*(old_track[field] for field in KEY_FIELDS))
+            new_key = track_key(*(new_track[field] for field in KEY_FIELDS))
+            if old_key != new_key:
+                self._remove(old_key, row_id)
+                self._add(new_key, row_id)
+
+
+def dedup_index(store):
+    """Индекс повторов хранилища (строится при первом обращении)"""
+    return store.get_derived('dedup_index', DedupIndex)
+
+
+def find_duplicate(tracks, track):
+    """Позиция (с 0) записи-повтора track или None"""
+    key = track_key(*(track[field] for field in KEY_FIELDS))
+    if isinstance(tracks, TrackStore):
+        row_id = dedup_index(tracks).find(key)
+        return None if row_id is None else tracks.position_of(row_id)
+    for position, existing in enumerate(tracks):
+        if track_key(*(existing[field] for field in KEY_FIELDS)) == key:
+            return position
+    return None
+
+
+def add_or_merge(tracks, track, policy='keep_max_plays'):
+    """
+    Добавление записи с проверкой повтора.
+    Возвращает (позиция записи с 0, результат), результат: 'added' - запись
+    добавлена, 'merged' - повтор объединен с имеющейся записью по политике,
+    'kept' - имеющаяся запись оставлена без изменений.
+    """
+    _check_policy(policy)
+    position = find_duplicate(tracks, track)
+    if position is None:
+        tracks.append(dict(track))
+        return len(tracks) - 1, 'added'
+    existing = tracks[position]
+    changes = merged_values(policy, existing, track)
+    if not changes:
+        return position, 'kept'
+    if isinstance(tracks, TrackStore):
+        row_id = tracks.row_ids[position]
+        tracks.set_values((row_id, field, value) for field, value in changes.items())
+    else:
+        existing.update(changes)
+    return position, 'merged'
+
+
+def merge_tracks(tracks, new_tracks, policy='keep_max_plays', chunk_size=MERGE_CHUNK):
+    """
+    Объединение потока записей с медиатекой (например, каталога партнера):
+    новые записи добавляются, повторы объединяются по политике.
+    Повторы внутри самого потока тоже объединяются, поэтому повторное слияние
+    того же каталога не увеличивает медиатеку. Новые записи добавляются
+    пакетами по chunk_size, изменения имеющихся - одним пакетом в конце.
+    Возвращает словарь с числом записей по результатам ('added', 'merged', 'kept').
+    """
+    _check_policy(policy)
+    is_store = isinstance(tracks, TrackStore)
+    if is_store:
+        # Индекс нужен только для записей, бывших до слияния: добавленные
+        # записи ищутся в added, а имеющиеся изменяются только в конце
+        find = dedup_index(tracks).find
+    else:
+        positions = {}
+        for position, track in enumerate(tracks):
+            positions.setdefault(track_key(*(track[field] for field in KEY_FIELDS)), position)
+        find = positions.get
+
+    counts = dict.fromkeys(('added', 'merged', 'kept'), 0)
+    added = {}  # ключ -> номер строки (позиция) записи, добавленной этим слиянием
+    pending = []
+    pending_keys = {}  # ключ -> номер записи в pending
+    updates = {}  # номер строки (позиция) -> запись после объединения
+
+    def flush():
+        first = len(tracks)
+        rows = tracks.extend(pending)  # хранилище возвращает номера добавленных строк
+        if rows is None:
+            rows = range(first, len(tracks))
+        for key, index in pending_keys.items():
+            added[key] = rows[index]
+        pending.clear()
+        pending_keys.clear()
+
+    for track in new_tracks:
+        key = track_key(*(track[field] for field in KEY_FIELDS))
+        index = pending_keys.get(key)
+        if index is not None:
+            current = pending[index]
+        else:
+            row = added.get(key)
+            if row is None:
+                row = find(key)
+            if row is None:
+                pending_keys[key] = len(pending)
+                new_track = {field: track[field] for field in FIELDS}
+                if 'track_id' in track:
+                    # Сохраненный идентификатор записи (загрузка файла медиатеки)
+                    new_track['track_id'] = track['track_id']
+                pending.append(new_track)
+                counts['added'] += 1
+                if len(pending) >= chunk_size:
+                    flush()
+                continue
+            current = updates.get(row)
+            if current is None:
+                current = updates[row] = dict(tracks.row(row) if is_store else tracks[row])
+        changes = merged_values(policy, current, track)
+        current.update(changes)
+        counts['merged' if changes else 'kept'] += 1
+    flush()
+
+    if is_store:
+        tracks.set_values((row_id, field, value)
+                          for row_id, track in updates.items() for field, value in track.items())
+    else:
+        for position, track in updates.items():
+            tracks[position].update(track)
+    return counts
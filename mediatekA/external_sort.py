@@ -0,0 +1,110 @@
+import os
+import pickle
+import tempfile
+from heapq import merge
+from itertools import islice
+
+import profiling
+from sorting import make_composite_key, sorted_positions
+from track_store import FIELDS
+
+# Внешняя сортировка для медиатек, не помещающихся в память:
+# поток записей делится на серии ограниченного размера, каждая серия
+# сортируется сортировкой Хоара (sorted_positions) и сбрасывается во временный
+# файл, затем серии сливаются кучей (heapq.merge) в выходной поток.
+# Ключ слияния - составной ключ записи и ее номер в исходном потоке, поэтому
+# порядок совпадает с устойчивой сортировкой в памяти (sort_by_multiple_keys).
+
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+RECORD_BYTES = 1024  # оценка памяти на запись серии вместе с ключами сортировки
+MIN_RUN_SIZE = 1000
+MAX_FAN_IN = 64  # сколько серий сливается за раз (открытых файлов)
+BLOCK_SIZE = 4096  # записей в одном блоке pickle файла серии
+
+
+def run_size_for(memory_limit):
+    """Число записей в серии для ограничения памяти memory_limit (в байтах)"""
+    return max(MIN_RUN_SIZE, memory_limit // RECORD_BYTES)
+
+
+def _write_run(directory, number, items):
+    """Запись серии (номер в потоке, кортеж значений полей) блоками; возвращает имя файла"""
+    path = os.path.join(directory, f"run_{number:06d}.bin")
+    with open(path, 'wb') as file:
+        while True:
+            block = list(islice(items, BLOCK_SIZE))
+            if not block:
+                break
+            pickle.dump(block, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path, key_func):
+    """Записи серии в виде (составной ключ + номер в потоке, словарь трека)"""
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                block = pickle.load(file)
+            except EOFError:
+                return
+            for sequence, values in block:
+                track = dict(zip(FIELDS, values))
+                yield key_func(track) + (sequence,), track
+
+
+def _merge_runs(paths, key_func):
+    return merge(*(_read_run(path, key_func) for path in paths))
+
+
+def external_sort(tracks, sort_specs, memory_limit=DEFAULT_MEMORY_LIMIT, run_size=None,
+                  temp_dir=None):
+    """
+    Генератор записей потока tracks в порядке sort_by_multiple_keys.
+    В памяти одновременно находится не больше одной серии (run_size записей,
+    по умолчанию - по memory_limit) и по блоку от каждой сливаемой серии.
+    Если поток умещается в одну серию, временные файлы не создаются.
+    Если серий больше MAX_FAN_IN, они предварительно сливаются группами.
+    Временные файлы удаляются по окончании или закрытии генератора.
+    """
+    run_size = run_size or run_size_for(memory_limit)
+    key_func = make_composite_key(sort_specs)
+    iterator = iter(tracks)
+    with tempfile.TemporaryDirectory(prefix='mediatek-sort-', dir=temp_dir) as directory:
+        runs = []
+        first = 0
+        while True:
+            with profiling.phase('sort.external.runs'):
+                run = list(islice(iterator, run_size))
+                if not run:
+                    break
+                positions = sorted_positions(run, sort_specs)
+                if not runs and len(run) < run_size:
+                    break  # весь поток уместился в одну серию
+                items = ((first + position, tuple(run[position][field] for field in FIELDS))
+                         for position in positions)
+                runs.append(_write_run(directory, len(runs), items))
+                first += len(run)
+                del run, positions
+
+        if not runs:
+            # Одна серия (или пустой поток) - выдается прямо из памяти
+            for position in (positions if run else ()):
+                yield run[position]
+            return
+
+        number = len(runs)
+        while len(runs) > MAX_FAN_IN:
+            with profiling.phase('sort.external.merge_pass'):
+                merged = []
+                for start in range(0, len(runs), MAX_FAN_IN):
+                    group = runs[start:start + MAX_FAN_IN]
+                    items = ((key[-1], tuple(track[field] for field in FIELDS))
+                             for key, track in _merge_runs(group, key_func))
+                    merged.append(_write_run(directory, number, items))
+                    number += 1
+                    for path in group:
+                        os.remove(path)
+                runs = merged
+
+        for _, track in _merge_runs(runs, key_func):
+            yield track
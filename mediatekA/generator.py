@@ -0,0 +1,88 @@
+import os
+import random
+
+from media_logic import REPORT_ALL_SORT_SPECS, sort_by_multiple_keys
+
+YEAR_MIN = 1960
+YEAR_MAX = 2025
+ORDERS = ('random', 'sorted', 'reversed')
+DUPLICATE_POOL = 1000  # сколько последних записей служат образцами для повторов
+
+
+def iter_generated_tracks(count, artists=200, duplicate_ratio=0.0, year_skew=0.0, seed=1):
+    """
+    Поток синтетических записей (словари) без хранения всей медиатеки.
+    artists - число различных исполнителей;
+    duplicate_ratio - доля записей, повторяющих ключи сортировки (исполнитель,
+    название, альбом, год, прослушивания) одной из недавних записей;
+    year_skew - смещение годов к YEAR_MAX: 0 - равномерно, чем больше, тем
+    сильнее записи сосредоточены в последних годах.
+    Последовательность определяется seed: при одинаковых параметрах
+    записи совпадают, поэтому замеры на разных машинах сравнимы.
+    """
+    rng = random.Random(seed)
+    artist_names = [f"Artist {i:04d}" for i in range(artists)]
+    year_span = YEAR_MAX - YEAR_MIN + 1
+    recent = []
+    for i in range(count):
+        if duplicate_ratio and recent and rng.random() < duplicate_ratio:
+            track = dict(rng.choice(recent))
+            track['duration'] = rng.randint(60, 600)
+            yield track
+            continue
+
+        artist = rng.choice(artist_names)
+        track = {
+            'artist': artist,
+            'title': f"Track {rng.randrange(count):07d}",
+            'album': f"{artist} Album {rng.randrange(10)}",
+        }
+        if year_skew:
+            track['year'] = YEAR_MAX - int(year_span * rng.random() ** (1 + year_skew))
+        else:
+            track['year'] = rng.randint(YEAR_MIN, YEAR_MAX)
+        track['duration'] = rng.randint(60, 600)
+        track['plays'] = rng.randrange(0, 10 ** 9, 1000)
+        if duplicate_ratio:
+            if len(recent) < DUPLICATE_POOL:
+                recent.append(track)
+            else:
+                recent[i % DUPLICATE_POOL] = track
+        yield track
+
+
+def generate_tracks(count, artists=200, duplicate_ratio=0.0, year_skew=0.0, order='random',
+                    seed=1):
+    """
+    Синтетическая медиатека заданного размера (список словарей).
+    order: 'random', 'sorted' или 'reversed' - порядок записей относительно
+    отчета 1 (для проверки сортировок на упорядоченных входных данных).
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Неизвестный порядок записей: {order}")
+    tracks = list(iter_generated_tracks(count, artists, duplicate_ratio, year_skew, seed))
+    if order != 'random':
+        tracks = sort_by_multiple_keys(tracks, REPORT_ALL_SORT_SPECS)
+        if order == 'reversed':
+            tracks.reverse()
+    return tracks
+
+
+def write_generated_library(filename, count, **options):
+    """
+    Запись синтетической медиатеки в текстовый файл формата tracks_data.txt.
+    Случайный порядок пишется потоком, без хранения записей в памяти.
+    Возвращает число записанных записей.
+    """
+    if options.get('order', 'random') == 'random':
+        options.pop('order', None)
+        tracks = iter_generated_tracks(count, **options)
+    else:
+        tracks = generate_tracks(count, **options)
+    temp_name = filename + '.tmp'
+    with open(temp_name, 'w', encoding='utf-8') as file:
+        for track in tracks:
+            file.write(f"{track['artist']};{track['title']};{track['album']};"
+                       f"{track['year']};{track['duration']};{track['plays']}\n")
+    os.replace(temp_name, filename)
+    return count
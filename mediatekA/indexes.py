@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+
+from profiling import profiled
+from track_store import StoreListener, TrackView, changed_rows, collation_key
+
+
+def normalize_artist(artist):
+    """Приведение имени исполнителя к виду для поиска без учета регистра"""
+    return collation_key(artist)
+
+
+def _remove_sorted(values, value):
+    """Удаление значения из отсортированного списка двоичным поиском"""
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+
+
+def mismatched_keys(actual, expected):
+    """Ключи, по которым два словаря индекса расходятся"""
+    return sorted(key for key in actual.keys() | expected.keys()
+                  if actual.get(key) != expected.get(key))
+
+
+class ArtistIndex(StoreListener):
+    """
+    Хеш-индекс: имя исполнителя без учета регистра -> номера строк.
+    Списки номеров строк отсортированы, то есть идут в порядке хранения записей.
+    """
+
+    def __init__(self, store):
+        self.rows_by_artist = {}
+        keys = store.pools['artist'].collation_keys()
+        column = store.columns['artist']
+        for row_id in store.row_ids:
+            self.rows_by_artist.setdefault(keys[column[row_id]], []).append(row_id)
+
+    @profiled('filter')
+    def find(self, store, artist_name):
+        """Записи исполнителя в порядке хранения"""
+        row_ids = self.rows_by_artist.get(normalize_artist(artist_name), ())
+        return TrackView(store, array('q', row_ids))
+
+    def _add(self, artist, row_id):
+        insort(self.rows_by_artist.setdefault(normalize_artist(artist), []), row_id)
+
+    def _remove(self, artist, row_id):
+        key = normalize_artist(artist)
+        row_ids = self.rows_by_artist.get(key)
+        if row_ids is not None:
+            _remove_sorted(row_ids, row_id)
+            if not row_ids:
+                del self.rows_by_artist[key]
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            self._add(store.get_value(row_id, 'artist'), row_id)
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            self._remove(store.get_value(row_id, 'artist'), row_id)
+
+    def rows_changed(self, store, changes):
+        # Несколько изменений одной записи в пакете: удаляется по исходному
+        # значению и добавляется по итоговому один раз
+        changes = [change for change in changes if change[1] == 'artist']
+        for row_id, old_track, new_track in changed_rows(store, changes):
+            self._remove(old_track['artist'], row_id)
+            self._add(new_track['artist'], row_id)
+
+    def check_consistency(self, store):
+        """Исполнители, чьи номера строк расходятся с заново построенным индексом"""
+        return mismatched_keys(self.rows_by_artist, ArtistIndex(store).rows_by_artist)
+
+
+class YearIndex(StoreListener):
+    """
+    Индекс по году выпуска: отсортированный список различных годов
+    (поиск диапазона двоичным поиском) и номера строк для каждого года.
+    """
+
+    def __init__(self, store):
+        self.rows_by_year = {}
+        column = store.columns['year']
+        for row_id in store.row_ids:
+            self.rows_by_year.setdefault(column[row_id], []).append(row_id)
+        self.years = sorted(self.rows_by_year)
+
+    def years_between(self, start_year, end_year):
+        """Различные годы выпуска в диапазоне [start_year, end_year]"""
+        return self.years[bisect_left(self.years, start_year):bisect_right(self.years, end_year)]
+
+    @profiled('filter')
+    def find(self, store, start_year, end_year):
+        """Записи с годом выпуска в диапазоне [start_year, end_year] в порядке хранения"""
+        groups = [self.rows_by_year[year] for year in self.years_between(start_year, end_year)]
+        if len(groups) == 1:
+            return TrackView(store, array('q', groups[0]))
+        return TrackView(store, array('q', merge(*groups)))
+
+    def _add(self, year, row_id):
+        row_ids = self.rows_by_year.get(year)
+        if row_ids is None:
+            self.rows_by_year[year] = [row_id]
+            insort(self.years, year)
+        else:
+            insort(row_ids, row_id)
+
+    def _remove(self, year, row_id):
+        row_ids = self.rows_by_year.get(year)
+        if row_ids is not None:
+            _remove_sorted(row_ids, row_id)
+            if not row_ids:
+                del self.rows_by_year[year]
+                _remove_sorted(self.years, year)
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            self._add(store.get_value(row_id, 'year'), row_id)
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            self._remove(store.get_value(row_id, 'year'), row_id)
+
+    def rows_changed(self, store, changes):
+        changes = [change for change in changes if change[1] == 'year']
+        for row_id, old_track, new_track in changed_rows(store, changes):
+            self._remove(old_track['year'], row_id)
+            self._add(new_track['year'], row_id)
+
+    def check_consistency(self, store):
+        """Годы, чьи номера строк расходятся с заново построенным индексом"""
+        expected = YearIndex(store)
+        mismatched = mismatched_keys(self.rows_by_year, expected.rows_by_year)
+        if not mismatched and self.years != expected.years:
+            mismatched = list(expected.years)  # список годов не отсортирован или с повторами
+        return mismatched
+
+
+def artist_index(store):
+    """Индекс исполнителей хранилища (строится при первом обращении)"""
+    return store.get_derived('artist_index', ArtistIndex)
+
+
+def year_index(store):
+    """Индекс годов выпуска хранилища (строится при первом обращении)"""
+    return store.get_derived('year_index', YearIndex)
@@ -0,0 +1,281 @@
+import json
+import os
+from bisect import bisect_left
+
+from loader import load_tracks_from_file, print_line_error, save_tracks_to_file
+from track_store import FIELDS, StoreListener
+
+JOURNAL_SUFFIX = '.journal'
+COMMIT_RECORD = b'{"op": "commit"}\n'  # отметка сохранения
+COMPACT_MIN_OPERATIONS = 10000  # минимальный размер журнала для сжатия
+
+
+class JournalError(Exception):
+    """Журнал не соответствует медиатеке, к которой применяется"""
+
+
+def base_signature(filename):
+    """Признак версии базового файла: размер и время изменения"""
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Journal(StoreListener):
+    """
+    Журнал изменений медиатеки, дописываемый в конец файла base + '.journal'.
+    Первая строка - заголовок с признаком базового файла, далее по строке JSON
+    на операцию: добавление (значения полей), удаление и изменение поля
+    (по позиции записи). Позиции не зависят от номеров строк хранилища,
+    поэтому журнал повторяется над заново загруженным базовым файлом.
+    Сохранение дописывает отметку {"op": "commit"} и вызывает fsync; при
+    восстановлении повторяются только операции до последней отметки, так что
+    несохраненные изменения теряются и при выходе без сохранения, и при сбое.
+    Если базовый файл был перезаписан (сжатие), старый журнал не применяется.
+    Файл журнала создается при первом изменении: загрузка без изменений
+    (например, cli.py report) ничего не пишет на диск. Если журнал записать
+    не удалось, при сохранении медиатека записывается в базовый файл целиком.
+    on_message(текст) - сообщения об ошибках журнала (по умолчанию print).
+    """
+
+    def __init__(self, base_filename, compact_after=COMPACT_MIN_OPERATIONS, on_message=print):
+        self.base_filename = base_filename
+        self.filename = base_filename + JOURNAL_SUFFIX
+        self.compact_after = compact_after
+        self.on_message = on_message
+        self.file = None
+        self.error = None
+        self.operations = 0
+        self.saved_size = 0
+
+    # Восстановление
+    def replay(self, store, on_message=print):
+        """
+        Повтор сохраненных операций журнала (до последней отметки сохранения)
+        над хранилищем, загруженным из базового файла; операции после нее
+        и недописанная последняя строка отбрасываются.
+        Нечитаемый заголовок или операция - JournalError.
+        Возвращает число примененных операций.
+        """
+        if not os.path.exists(self.filename):
+            return 0
+        with open(self.filename, 'rb') as file:
+            lines = file.readlines()
+        if not lines:
+            return 0
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            raise JournalError("некорректный заголовок журнала") from None
+        if not isinstance(header, dict):
+            raise JournalError("некорректный заголовок журнала")
+        if header.get('base') != base_signature(self.base_filename):
+            on_message(f"Журнал {self.filename} относится к другой версии файла и не применяется")
+            return 0
+
+        records = []
+        committed = 0
+        for line in lines[1:]:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            records.append(record)
+            if isinstance(record, dict) and record.get('op') == 'commit':
+                committed = len(records)
+
+        valid_size = sum(len(line) for line in lines[:committed + 1])
+        applied = 0
+        for record in records[:committed]:
+            if record['op'] != 'commit':
+                self._apply(store, record)
+                applied += 1
+
+        self.operations = applied
+        self.saved_size = valid_size
+        if valid_size < sum(len(line) for line in lines):
+            with open(self.filename, 'r+b') as file:
+                file.truncate(valid_size)
+        return applied
+
+    @staticmethod
+    def _apply(store, record):
+        operation = record['op']
+        if operation == 'add':
+            store.append_values(*record['values'])
+        elif operation == 'delete':
+            store.pop(record['position'])
+        elif operation == 'update':
+            if record['field'] not in FIELDS:
+                raise JournalError(f"неизвестное поле в журнале: {record['field']}")
+            store.set_value(store.row_ids[record['position']], record['field'], record['value'])
+        else:
+            raise JournalError(f"неизвестная операция в журнале: {operation}")
+
+    # Запись
+    def open(self, store):
+        """Начало записи журнала: хранилище будет сообщать о каждом изменении"""
+        store.add_listener(self)
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.sync()
+                self.file.close()
+            except OSError as e:
+                self.on_message(f"Ошибка при записи журнала: {e}")
+            self.file = None
+
+    def _open_file(self):
+        """Открытие файла журнала при первом изменении (новый - с заголовком)"""
+        if self.operations == 0:
+            self._reset()
+        self.file = open(self.filename, 'ab')
+
+    def _fail(self, error):
+        """Журнал недоступен: изменения сохранятся только записью базового файла"""
+        self.error = error
+        self.on_message(f"Ошибка при записи журнала: {error}. "
+                        f"Изменения будут записаны в {self.base_filename} при сохранении")
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+    def _reset(self):
+        """Новый пустой журнал для текущего базового файла (атомарная замена)"""
+        header = json.dumps({'base': base_signature(self.base_filename)}) + '\n'
+        temp_name = self.filename + '.tmp'
+        with open(temp_name, 'wb') as file:
+            file.write(header.encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, self.filename)
+        self.saved_size = len(header)
+        self.operations = 0
+
+    def _write(self, record):
+        if self.error is not None:
+            return
+        try:
+            if self.file is None:
+                self._open_file()
+            self.file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            self.operations += 1
+        except OSError as e:
+            self._fail(e)
+
+    def sync(self):
+        """Сброс накопленных записей журнала на диск"""
+        if self.file is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            self._write({'op': 'add', 'values': list(store.row(row_id).values())})
+
+    def rows_removed(self, store, row_ids):
+        # Позиции до удаления; записываются с конца, чтобы при повторе
+        # каждое удаление не сдвигало позиции следующих
+        row_ids = sorted(row_ids)
+        positions = [bisect_left(store.row_ids, row_id) + removed_before
+                     for removed_before, row_id in enumerate(row_ids)]
+        for position in reversed(positions):
+            self._write({'op': 'delete', 'position': position})
+
+    def rows_changed(self, store, changes):
+        for row_id, field, _ in changes:
+            self._write({'op': 'update', 'position': store.position_of(row_id),
+                         'field': field, 'value': store.get_value(row_id, field)})
+
+    # Сохранение
+    def save(self, store):
+        """
+        Фиксация изменений: отметка сохранения и fsync журнала
+        (O(1) операций ввода-вывода).
+        Когда журнал становится сравним с медиатекой или его не удалось
+        записать, медиатека записывается в базовый файл (сжатие).
+        """
+        if self.error is not None:
+            return self.compact(store)
+        try:
+            if self.file is not None and self.file.tell() > self.saved_size:
+                self.file.write(COMMIT_RECORD)
+                self.sync()
+                self.saved_size = self.file.tell()
+        except OSError as e:
+            self._fail(e)
+            return self.compact(store)
+        if self.operations >= max(self.compact_after, len(store) // 2):
+            return self.compact(store)
+        return True
+
+    def compact(self, store):
+        """
+        Сжатие: медиатека записывается в новый базовый файл (атомарная замена),
+        затем журнал начинается заново. При сбое между этими шагами старый
+        журнал не применяется, так как не совпадает признак базового файла.
+        """
+        if not save_tracks_to_file(self.base_filename, store):
+            return False
+        self.close()
+        self.error = None
+        try:
+            self._reset()
+        except OSError as e:
+            # Старый журнал не совпадает с новым базовым файлом и не будет применен
+            self.on_message(f"Ошибка при записи журнала: {e}")
+            self.operations = 0
+        return True
+
+    def discard_unsaved(self):
+        """Отмена изменений после последнего сохранения (выход без сохранения)"""
+        if self.file is None:
+            return
+        try:
+            self.file.flush()
+            self.file.truncate(self.saved_size)
+            self.file.seek(self.saved_size)
+            self.sync()
+        except OSError as e:
+            self._fail(e)
+
+
+def load_with_journal(filename, on_progress=None, on_message=print, on_error=print_line_error,
+                      workers=1):
+    """
+    Загрузка медиатеки с повтором журнала изменений; возвращает (записи, журнал).
+    on_progress, on_message и on_error - ход чтения, сообщения загрузки и ошибки
+    строк файла, workers - число процессов разбора (см. load_tracks_from_file).
+    """
+    def load():
+        return load_tracks_from_file(filename, on_error=on_error, on_progress=on_progress,
+                                     on_message=on_message, workers=workers)
+
+    tracks = load()
+    journal = Journal(filename, on_message=on_message)
+    if not tracks:
+        return tracks, journal
+    applied = 0
+    try:
+        applied = journal.replay(tracks, on_message)
+    except OSError as e:
+        on_message(f"Ошибка при чтении журнала: {e}")
+    except (JournalError, KeyError, IndexError, TypeError, ValueError) as e:
+        on_message(f"Ошибка при восстановлении журнала: {e}")
+        try:
+            os.replace(journal.filename, journal.filename + '.bad')
+            on_message(f"Журнал сохранен как {journal.filename}.bad, загружен только базовый файл")
+        except OSError as e:
+            on_message(f"Не удалось переименовать журнал: {e}; загружен только базовый файл")
+        tracks = load()
+        journal = Journal(filename, on_message=on_message)
+    if applied:
+        on_message(f"Восстановлено изменений из журнала: {applied}")
+    journal.open(tracks)
+    return tracks, journal
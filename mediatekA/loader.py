@@ -1,41 +1,320 @@
-def load_tracks_from_file(filename):
-    """Загрузка аудиозаписей из текстового файла"""
-    tracks = []
+import csv
+import io
+import json
+import os
+import sys
+from array import array
+from itertools import chain, islice
 
+import profiling
+from dedup import merge_tracks
+from profiling import profiled
+from snapshot import SNAPSHOT_EXTENSION, SnapshotError, is_snapshot, open_snapshot, write_snapshot
+from track_store import FIELDS, TrackStore, TrackView
+
+
+BATCH_SIZE = 10000
+FIELD_COUNT = 6
+
+
+def parse_track_line(line):
+    """
+    Разбор строки файла: кортеж (исполнитель, название, альбом, год, длительность,
+    прослушивания, идентификатор). Седьмое поле - постоянный идентификатор
+    записи; в файлах без него идентификатор равен None.
+    При ошибке формата - ValueError с описанием.
+    """
+    parts = line.split(';')
+    if len(parts) not in (FIELD_COUNT, FIELD_COUNT + 1):
+        raise ValueError(f"ожидалось {FIELD_COUNT} или {FIELD_COUNT + 1} полей через ';', "
+                         f"получено {len(parts)}")
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    parts = line.split(';')
-                    if len(parts) == 6:
-                        track = {
-                            'artist': parts[0].strip(),
-                            'title': parts[1].strip(),
-                            'album': parts[2].strip(),
-                            'year': int(parts[3].strip()),
-                            'duration': int(parts[4].strip()),
-                            'plays': int(parts[5].strip())
-                        }
-                        tracks.append(track)
-        print(f"Загружено {len(tracks)} записей из файла {filename}")
+        values = (parts[0].strip(), parts[1].strip(), parts[2].strip(),
+                  int(parts[3]), int(parts[4]), int(parts[5]))
+    except ValueError:
+        raise ValueError("год, длительность и прослушивания должны быть целыми числами") from None
+    if len(parts) == FIELD_COUNT:
+        return values + (None,)
+    try:
+        track_id = int(parts[FIELD_COUNT])
+    except ValueError:
+        track_id = 0
+    if track_id <= 0:
+        raise ValueError("идентификатор записи должен быть положительным целым числом")
+    return values + (track_id,)
+
+
+def format_line_error(line_number, line, message):
+    """Текст ошибки разбора строки файла"""
+    return f"Строка {line_number} пропущена: {message}: {line!r}"
+
+
+def print_line_error(line_number, line, message):
+    """Вывод ошибки разбора строки файла"""
+    print(format_line_error(line_number, line, message))
+
+
+def iter_track_batches(filename, batch_size=BATCH_SIZE, on_error=print_line_error,
+                       on_progress=None):
+    """
+    Потоковое чтение файла: генератор списков разобранных записей (кортежей
+    значений полей и идентификатора, см. parse_track_line) длиной до batch_size.
+    Пустые строки пропускаются, для
+    некорректных вызывается on_error(номер_строки, строка, сообщение).
+    on_progress(прочитано_байт, размер_файла) вызывается перед выдачей каждого списка.
+    """
+    batch = []
+    with open(filename, 'r', encoding='utf-8') as file:
+        size = os.fstat(file.fileno()).st_size
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(parse_track_line(line))
+            except ValueError as e:
+                if on_error is not None:
+                    on_error(line_number, line, str(e))
+                continue
+            if len(batch) >= batch_size:
+                if on_progress is not None:
+                    # Позиция буфера опережает разобранные строки не больше чем на блок чтения
+                    on_progress(file.buffer.tell(), size)
+                yield batch
+                batch = []
+        if on_progress is not None:
+            on_progress(size, size)
+    if batch:
+        yield batch
+
+
+def iter_tracks(filename, batch_size=BATCH_SIZE, on_error=print_line_error):
+    """
+    Потоковое чтение файла по одной записи в виде словаря трека.
+    Идентификаторы из файла не передаются: записи другого файла (например,
+    каталога) получают идентификаторы медиатеки, в которую добавляются.
+    """
+    for batch in iter_track_batches(filename, batch_size, on_error):
+        for artist, title, album, year, duration, plays, _ in batch:
+            yield {
+                'artist': artist,
+                'title': title,
+                'album': album,
+                'year': year,
+                'duration': duration,
+                'plays': plays
+            }
+
+
+@profiled('load')
+def load_tracks_from_file(filename, batch_size=BATCH_SIZE, on_error=print_line_error,
+                          merge_policy=None, on_progress=None, on_message=print, workers=1):
+    """
+    Загрузка аудиозаписей из текстового файла в колоночное хранилище.
+    Бинарный снимок (определяется по сигнатуре) открывается через mmap.
+    merge_policy - политика объединения повторов (см. dedup.MERGE_POLICIES);
+    по умолчанию повторы загружаются как есть.
+    on_progress(прочитано_байт, размер_файла) - ход чтения текстового файла.
+    on_message(текст) - итоговые сообщения и ошибки загрузки (по умолчанию print).
+    workers - число процессов разбора текстового файла (None - по числу ядер),
+    см. iter_parsed_chunks; по умолчанию файл читается в текущем процессе.
+    """
+    if is_snapshot(filename):
+        try:
+            tracks = open_snapshot(filename)
+        except (OSError, SnapshotError) as e:
+            on_message(f"Ошибка при загрузке снимка: {e}")
+            return TrackStore()
+        on_message(f"Открыт снимок {filename}: {len(tracks)} записей")
+        return tracks
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tracks = TrackStore()
+    skipped = []
+
+    def count_error(line_number, line, message):
+        skipped.append(line_number)
+        if on_error is not None:
+            on_error(line_number, line, message)
+
+    try:
+        if workers > 1 and merge_policy is None:
+            # Части файла уже закодированы в процессах разбора: строки
+            # добавляются в хранилище блоками, без разбора по записям
+            chunks = iter_parsed_chunks(filename, workers, count_error, on_progress)
+            if profiling.current is not None:
+                chunks = profiling.current.timed_iter('load.parse', chunks)
+            for strings, string_columns, numeric_columns, track_ids in chunks:
+                with profiling.phase('load.store'):
+                    tracks.append_encoded(strings, *string_columns, *numeric_columns, track_ids)
+        else:
+            if workers > 1:
+                batches = (list(_chunk_values(*chunk)) for chunk in
+                           iter_parsed_chunks(filename, workers, count_error, on_progress))
+            else:
+                batches = iter_track_batches(filename, batch_size, count_error, on_progress)
+            if profiling.current is not None:
+                batches = profiling.current.timed_iter('load.parse', batches)
+            if merge_policy is None:
+                for batch in batches:
+                    with profiling.phase('load.store'):
+                        for values in batch:
+                            tracks.append_values(*values)
+            else:
+                with profiling.phase('load.merge'):
+                    counts = merge_tracks(tracks, (dict(zip(FIELDS + ('track_id',), values))
+                                                   for batch in batches for values in batch),
+                                          merge_policy)
+        if workers > 1:
+            on_message(f"Загружено {len(tracks)} записей из файла {filename} "
+                       f"({workers} процессов)")
+        else:
+            on_message(f"Загружено {len(tracks)} записей из файла {filename}")
+        if merge_policy is not None and counts['merged'] + counts['kept']:
+            on_message(f"Объединено повторов: {counts['merged'] + counts['kept']}")
+        if skipped:
+            on_message(f"Пропущено некорректных строк: {len(skipped)}")
         return tracks
     except FileNotFoundError:
-        print(f"Ошибка: файл {filename} не найден!")
-        return []
-    except Exception as e:
-        print(f"Ошибка при загрузке данных: {e}")
-        return []
+        on_message(f"Ошибка: файл {filename} не найден!")
+        return TrackStore()
+    except (OSError, UnicodeDecodeError) as e:
+        on_message(f"Ошибка при загрузке данных: {e}")
+        return TrackStore()
+
 
+def split_file(filename, parts):
+    """Границы частей файла (смещения в байтах), выровненные по началу строк"""
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as file:
+        for part in range(1, parts):
+            position = max(size * part // parts, offsets[-1])
+            if position >= size:
+                break
+            file.seek(position)
+            file.readline()
+            position = file.tell()
+            if position >= size:
+                break
+            if position > offsets[-1]:
+                offsets.append(position)
+    offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
 
-def save_tracks_to_file(filename, tracks):
-    """Сохранение аудиозаписей в текстовый файл"""
+
+def parse_chunk(filename, start, end):
+    """
+    Разбор части файла [start, end) в рабочем процессе.
+    Строки кодируются локальным словарем, числа - массивами array, чтобы
+    результат быстро передавался обратно. Возвращает словарь блока, колонки,
+    идентификаторы (0 - не указан), число строк части и ошибки
+    (номер строки в части, строка, сообщение).
+    """
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start).decode('utf-8')
+
+    string_ids = {}
+    string_columns = ([], [], [])
+    numeric_columns = (array('i'), array('i'), array('q'))
+    track_ids = array('q')
+    errors = []
+    line_count = 0
+    # Концы строк - по тем же правилам, что у open() в текстовом режиме
+    # (\n, \r\n, \r), а не str.splitlines(): она делит и по \x0b, \x0c, \x85 и др.
+    for line_number, line in enumerate(io.StringIO(data, newline=None), 1):
+        line_count = line_number
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            values = parse_track_line(line)
+        except ValueError as e:
+            errors.append((line_number, line, str(e)))
+            continue
+        for column, value in zip(string_columns, values):
+            column.append(string_ids.setdefault(value, len(string_ids)))
+        for column, value in zip(numeric_columns, values[3:]):
+            column.append(value)
+        track_ids.append(values[6] or 0)
+    strings = list(string_ids)
+    return strings, string_columns, numeric_columns, track_ids, line_count, errors
+
+
+def iter_parsed_chunks(filename, workers, on_error=print_line_error, on_progress=None):
+    """
+    Параллельный разбор: файл делится на части по границам строк, части
+    разбираются в пуле из workers процессов. Генератор выдает части в исходном
+    порядке: (словарь блока, колонки строк, числовые колонки, идентификаторы),
+    см. parse_chunk. Для некорректных строк вызывается on_error с номером строки
+    файла, on_progress(прочитано_байт, размер_файла) - после каждой части.
+    """
+    from concurrent.futures import ProcessPoolExecutor  # пул процессов нужен только здесь
+
+    size = os.path.getsize(filename)
+    chunks = split_file(filename, workers * 4)
+    executor = ProcessPoolExecutor(max_workers=workers)
     try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            for track in tracks:
-                line = f"{track['artist']};{track['title']};{track['album']};"
-                line += f"{track['year']};{track['duration']};{track['plays']}\n"
-                file.write(line)
+        results = executor.map(parse_chunk, [filename] * len(chunks),
+                               [start for start, _ in chunks], [end for _, end in chunks])
+        lines_before = 0
+        for (_, end), (strings, string_columns, numeric_columns, track_ids,
+                       line_count, errors) in zip(chunks, results):
+            if on_error is not None:
+                for line_number, line, message in errors:
+                    on_error(lines_before + line_number, line, message)
+            lines_before += line_count
+            if on_progress is not None:
+                on_progress(end, size)
+            yield strings, string_columns, numeric_columns, track_ids
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _chunk_values(strings, string_columns, numeric_columns, track_ids):
+    """Кортежи значений записей разобранной части (как у parse_track_line)"""
+    artists, titles, albums = string_columns
+    years, durations, plays = numeric_columns
+    for values in zip(artists, titles, albums, years, durations, plays, track_ids):
+        yield (strings[values[0]], strings[values[1]], strings[values[2]],
+               values[3], values[4], values[5], values[6] or None)
+
+
+@profiled('save')
+def save_tracks_to_file(filename, tracks, file_format=None):
+    """
+    Сохранение аудиозаписей в текстовый файл или бинарный снимок.
+    file_format: 'text', 'binary' или None - по расширению файла (.mtks - снимок).
+    Записи хранилища сохраняются вместе с постоянными идентификаторами.
+    """
+    if file_format is None:
+        file_format = 'binary' if filename.endswith(SNAPSHOT_EXTENSION) else 'text'
+    try:
+        if file_format == 'binary':
+            write_snapshot(filename, tracks)
+            print(f"Сохранено {len(tracks)} записей в снимок {filename}")
+            return True
+        rows = _track_values(tracks)
+        track_ids = _track_ids(tracks)
+        # Запись во временный файл и атомарная замена: сбой не портит прежний файл
+        temp_name = filename + '.tmp'
+        with open(temp_name, 'w', encoding='utf-8') as file:
+            if track_ids is None:
+                for artist, title, album, year, duration, plays in rows:
+                    line = f"{artist};{title};{album};"
+                    line += f"{year};{duration};{plays}\n"
+                    file.write(line)
+            else:
+                for values, track_id in zip(rows, track_ids):
+                    artist, title, album, year, duration, plays = values
+                    line = f"{artist};{title};{album};"
+                    line += f"{year};{duration};{plays};{track_id}\n"
+                    file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, filename)
         print(f"Сохранено {len(tracks)} записей в файл {filename}")
         return True
     except Exception as e:
@@ -43,45 +322,151 @@ def save_tracks_to_file(filename, tracks):
         return False
 
 
+def convert_tracks_file(source, target, file_format=None):
+    """Преобразование медиатеки между текстовым форматом и бинарным снимком"""
+    tracks = load_tracks_from_file(source)
+    if not tracks:
+        return False
+    return save_tracks_to_file(target, tracks, file_format)
+
+
+TABLE_WIDTH = 140
+RENDER_BATCH_SIZE = 1000
+
+
+def format_track_values(artist, title, album, year, duration, plays, index=None):
+    """Строка таблицы по значениям полей трека"""
+    line = (f"{artist:25} | {title:30} | {album:35} | {year:4} | "
+            f"{duration // 60:2}:{duration % 60:02d} | {plays:>15,}")
+    if index is not None:
+        return f"{index:3}. {line}"
+    return line
+
+
 def display_track(track, index=None):
     """Отображение информации о треке с возможной нумерацией"""
-    minutes = track['duration'] // 60
-    seconds = track['duration'] % 60
+    return format_track_values(track['artist'], track['title'], track['album'],
+                               track['year'], track['duration'], track['plays'], index)
 
-    if index is not None:
-        return (f"{index:3}. {track['artist']:25} | {track['title']:30} | "
-                f"{track['album']:35} | {track['year']:4} | "
-                f"{minutes:2}:{seconds:02d} | {track['plays']:>15,}")
-    else:
-        return (f"{track['artist']:25} | {track['title']:30} | "
-                f"{track['album']:35} | {track['year']:4} | "
-                f"{minutes:2}:{seconds:02d} | {track['plays']:>15,}")
+
+def _track_values(tracks):
+    """Кортежи значений полей; для хранилища читаются прямо из колонок"""
+    if hasattr(tracks, 'iter_values'):
+        return tracks.iter_values()
+    return ((t['artist'], t['title'], t['album'], t['year'], t['duration'], t['plays'])
+            for t in tracks)
 
 
-def display_tracks_table(tracks, title=None, show_index=False):
-    """Отображение списка треков в виде таблицы"""
+def _track_ids(tracks):
+    """Постоянные идентификаторы записей выборки хранилища; None для списка словарей"""
+    if isinstance(tracks, TrackView):
+        ids = tracks.store.ids
+        return (ids[row_id] for row_id in tracks.row_ids)
+    return None
+
+
+@profiled('render')
+def render_tracks_table(tracks, title=None, show_index=False, offset=0, limit=None,
+                        out=None, batch_size=RENDER_BATCH_SIZE):
+    """
+    Буферизованный вывод таблицы треков.
+    tracks - последовательность или итератор (например, ленивый результат
+    сортировки): строки форматируются пачками по batch_size и выводятся одной
+    записью, поэтому первая пачка появляется сразу. offset и limit задают
+    выводимый диапазон строк, номера строк соответствуют позициям в списке.
+    Возвращает число выведенных строк.
+    """
+    out = out or sys.stdout
+    total = len(tracks) if hasattr(tracks, '__len__') else None
+
     if title:
-        print("\n" + "=" * 140)
-        print(title.center(140))
-        print("=" * 140)
+        out.write("\n" + "=" * TABLE_WIDTH + "\n" + title.center(TABLE_WIDTH) + "\n"
+                  + "=" * TABLE_WIDTH + "\n")
 
-    if not tracks:
-        print("Записи не найдены")
-        return
+    stop = None if limit is None else offset + limit
+    if total is not None and hasattr(tracks, '__getitem__'):
+        rows = _track_values(tracks[offset:stop])
+    else:
+        rows = islice(_track_values(tracks), offset, stop)
+    first = next(rows, None)
+    if first is None:
+        out.write("Записи не найдены\n")
+        return 0
 
-    if show_index:
-        print(f"{'№':3} | {'Исполнитель':25} | {'Название трека':30} | {'Альбом':35} | "
+    header = (f"{'Исполнитель':25} | {'Название трека':30} | {'Альбом':35} | "
               f"{'Год':4} | {'Длит.':6} | {'Прослушивания':>15}")
+    if show_index:
+        header = f"{'№':3} | {header}"
+    out.write(header + "\n" + "-" * TABLE_WIDTH + "\n")
+
+    shown = 0
+    batch = []
+    for values in chain((first,), rows):
+        shown += 1
+        batch.append(format_track_values(*values, offset + shown if show_index else None))
+        if len(batch) >= batch_size:
+            out.write("\n".join(batch) + "\n")
+            out.flush()
+            batch = []
+    if batch:
+        out.write("\n".join(batch) + "\n")
+
+    if total is None:
+        out.write(f"\nПоказано записей: {shown}\n")
+    elif shown < total:
+        out.write(f"\nПоказаны записи {offset + 1}-{offset + shown} из {total}\n")
     else:
-        print(f"{'Исполнитель':25} | {'Название трека':30} | {'Альбом':35} | "
-              f"{'Год':4} | {'Длит.':6} | {'Прослушивания':>15}")
+        out.write(f"\nВсего записей: {total}\n")
+    out.flush()
+    return shown
 
-    print("-" * 140)
 
-    for i, track in enumerate(tracks, 1):
-        if show_index:
-            print(display_track(track, i))
-        else:
-            print(display_track(track))
+def display_tracks_table(tracks, title=None, show_index=False, page_size=None, page=1):
+    """
+    Отображение списка треков в виде таблицы.
+    page_size - размер страницы (по умолчанию выводится весь список), page - номер страницы с 1.
+    """
+    offset = 0 if page_size is None else (page - 1) * page_size
+    return render_tracks_table(tracks, title, show_index, offset, page_size)
+
+
+def write_tracks_csv(tracks, out, query=None, header=True):
+    """
+    Выгрузка треков в CSV (для скриптов и конвейеров).
+    query - необязательная метка запроса, добавляемая первой колонкой.
+    Для записей хранилища последняя колонка - постоянный идентификатор track_id.
+    """
+    writer = csv.writer(out)
+    prefix = () if query is None else (query,)
+    track_ids = _track_ids(tracks)
+    if header:
+        writer.writerow((('query',) if query is not None else ()) + FIELDS
+                        + (() if track_ids is None else ('track_id',)))
+    count = 0
+    if track_ids is None:
+        for values in _track_values(tracks):
+            writer.writerow(prefix + values)
+            count += 1
+    else:
+        for values, track_id in zip(_track_values(tracks), track_ids):
+            writer.writerow(prefix + values + (track_id,))
+            count += 1
+    return count
+
 
-    print(f"\nВсего записей: {len(tracks)}")
\ No newline at end of file
+def write_tracks_jsonl(tracks, out, query=None):
+    """
+    Выгрузка треков по объекту JSON в строке; query - необязательная метка запроса.
+    Записи хранилища содержат постоянный идентификатор track_id.
+    """
+    count = 0
+    track_ids = _track_ids(tracks)
+    for values in _track_values(tracks):
+        record = dict(zip(FIELDS, values))
+        if track_ids is not None:
+            record['track_id'] = next(track_ids)
+        if query is not None:
+            record = {'query': query, **record}
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
\ No newline at end of file
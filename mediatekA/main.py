@@ -1,11 +1,112 @@
-from loader import load_tracks_from_file, save_tracks_to_file, display_tracks_table
-from media_logic import report_all_sorted, report_by_artist, report_by_year_range
-
-
-def display_menu():
-    """Отображение главного меню"""
+import time
+
+STARTED = time.perf_counter()  # до остальных импортов: время до меню учитывает и их
+
+import sys
+import threading
+
+from dedup import add_or_merge
+from journal import load_with_journal
+from loader import display_tracks_table, format_line_error
+from profiling import profiling
+from validation import validate_track_data
+
+# Отчеты (индексы и представления) и поиск импортируются при первом отчете,
+# движок numpy и пул процессов - только при обращении к ним, поэтому меню
+# показывается сразу, а медиатека загружается в фоне (BackgroundLoad).
+
+ADD_MERGE_POLICY = 'keep_max_plays'  # объединение повторов при добавлении из меню
+PROGRESS_INTERVAL = 0.2  # период обновления индикатора загрузки, секунды
+MAX_LINE_ERRORS = 10  # сколько пропущенных строк файла показывать (итог выводит загрузчик)
+
+
+class BackgroundLoad:
+    """
+    Загрузка медиатеки с журналом в фоновом потоке.
+    Поток ничего не выводит сам: сообщения загрузчика копятся и показываются
+    в строке состояния меню (status()), чтобы не печатать поверх вводимого
+    пользователем выбора. wait() дожидается окончания с индикатором прогресса
+    и возвращает (записи, журнал).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.bytes_read = 0
+        self.total_bytes = 0
+        self.tracks = None
+        self.journal = None
+        self.error = None
+        self.messages = []
+        self.line_errors = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='mediatek-load', daemon=True)
+        self.thread.start()
+
+    def _progress(self, bytes_read, total_bytes):
+        self.bytes_read, self.total_bytes = bytes_read, total_bytes
+
+    def _message(self, text):
+        with self.lock:
+            self.messages.append(text)
+
+    def _line_error(self, line_number, line, message):
+        self.line_errors += 1
+        if self.line_errors <= MAX_LINE_ERRORS:
+            self._message(format_line_error(line_number, line, message))
+
+    def _run(self):
+        try:
+            self.tracks, self.journal = load_with_journal(self.filename, self._progress,
+                                                          self._message, self._line_error)
+        except Exception as e:  # передается в основной поток при ожидании
+            self.error = e
+
+    @property
+    def done(self):
+        return not self.thread.is_alive()
+
+    def take_messages(self):
+        """Сообщения загрузчика, еще не показанные пользователю"""
+        with self.lock:
+            messages, self.messages = self.messages, []
+        return messages
+
+    def status(self):
+        """
+        Состояние загрузки для меню: ход загрузки (пока она идет) и новые
+        сообщения загрузчика; None, если показывать нечего
+        """
+        lines = []
+        if not self.done:
+            if self.total_bytes:
+                lines.append(f"Загрузка медиатеки: {self.bytes_read * 100 // self.total_bytes}%")
+            else:
+                lines.append("Загрузка медиатеки...")
+        lines.extend(self.take_messages())
+        return "\n".join(lines) or None
+
+    def wait(self):
+        """Ожидание окончания загрузки с индикатором прогресса; возвращает (записи, журнал)"""
+        if not self.done:
+            while not self.done:
+                print(f"\rЗагрузка медиатеки: {self.bytes_read * 100 // max(self.total_bytes, 1)}%",
+                      end='', flush=True)
+                self.thread.join(PROGRESS_INTERVAL)
+            print()
+        for message in self.take_messages():
+            print(message)
+        if self.error is not None:
+            raise self.error
+        return self.tracks, self.journal
+
+
+def display_menu(status=None):
+    """Отображение главного меню (status - строки состояния загрузки)"""
     print("\n" + "=" * 60)
     print("МЕДИАТЕКА - Управление аудиозаписями".center(60))
+    if status:
+        for line in status.splitlines():
+            print(line.center(60))
     print("=" * 60)
     print("1. Показать исходные данные ")
     print("2. Отчет 1: Полный отсортированный список ")
@@ -20,42 +121,6 @@ def display_menu():
     return input("Выберите действие (1-9): ").strip()
 
 
-def validate_track_data(artist, title, album, year, duration, plays):
-    """Проверка корректности числовых данных"""
-    errors = []
-
-    # Проверка строковых полей
-    if not artist or not artist.strip():
-        errors.append("Исполнитель не может быть пустым")
-    elif len(artist.strip()) < 1:
-        errors.append("Исполнитель должен содержать минимум 1 символ")
-
-    if not title or not title.strip():
-        errors.append("Название трека не может быть пустым")
-    elif len(title.strip()) < 1:
-        errors.append("Название трека должно содержать минимум 1 символ")
-
-    if not album or not album.strip():
-        errors.append("Альбом не может быть пустым")
-    elif len(album.strip()) < 1:
-        errors.append("Альбом должен содержать минимум 1 символ")
-
-    if year < 1900 or year > 2026:
-        errors.append("Год должен быть в диапазоне 1900-2026")
-
-    if duration <= 0:
-        errors.append("Длительность должна быть положительным числом")
-    elif duration > 3600:  # больше 1 часа
-        errors.append("Длительность не должна превышать 3600 секунд (1 час)")
-
-    if plays < 0:
-        errors.append("Количество прослушиваний не может быть отрицательным")
-    elif plays > 1000000000000:
-        errors.append("Количество прослушиваний слишком велико")
-
-    return errors
-
-
 def add_new_track(tracks):
     """Добавление новой аудиозаписи"""
     print("\n" + "=" * 60)
@@ -105,9 +170,17 @@ def add_new_track(tracks):
             'duration': duration,
             'plays': plays
         }
-        tracks.append(new_track)
-        print(f"\nЗапись '{title}' исполнителя '{artist}' успешно добавлена!")
-        return True
+        # Повтор (тот же исполнитель, название и альбом) не добавляется второй раз
+        position, result = add_or_merge(tracks, new_track, ADD_MERGE_POLICY)
+        if result == 'added':
+            print(f"\nЗапись '{title}' исполнителя '{artist}' успешно добавлена!")
+            return True
+        print(f"\nЗапись '{title}' исполнителя '{artist}' уже есть в медиатеке (№{position + 1})")
+        if result == 'merged':
+            print("Запись заменена новой: у нее больше прослушиваний.")
+            return True
+        print("Запись не изменена: в медиатеке больше прослушиваний.")
+        return False
 
     except ValueError:
         print("Ошибка: некорректные числовые данные!")
@@ -351,16 +424,24 @@ def edit_track(tracks):
         print("Ошибка: введите корректный номер!")
         return tracks
 
-def main():
-    # Загрузка исходных данных
-    tracks = load_tracks_from_file("tracks_data.txt")
-
-    if not tracks:
-        print("Невозможно загрузить данные! Проверьте файл tracks_data.txt")
-        return
+def main(show_startup_time=False):
+    # Загрузка исходных данных и изменений из журнала - в фоне, меню показывается сразу
+    loading = BackgroundLoad("tracks_data.txt")
+    tracks = journal = None
 
     while True:
-        choice = display_menu()
+        status = loading.status()
+        if show_startup_time:
+            print(f"Меню показано через {(time.perf_counter() - STARTED) * 1000:.1f} мс после запуска")
+            show_startup_time = False
+        choice = display_menu(status)
+
+        if tracks is None and choice in ("1", "2", "3", "4", "5", "6", "7", "8", "9"):
+            # Данные нужны действию: ожидание окончания загрузки
+            tracks, journal = loading.wait()
+            if not tracks:
+                print("Невозможно загрузить данные! Проверьте файл tracks_data.txt")
+                return
 
         if choice == "1":
             # Показать исходные данные без сортировки
@@ -368,7 +449,8 @@ def main():
 
         elif choice == "2":
             # Отчет 1
-            sorted_tracks = report_all_sorted(tracks)
+            from report_cache import cached_report_all_sorted
+            sorted_tracks = cached_report_all_sorted(tracks)
             display_tracks_table(sorted_tracks, "ОТЧЕТ 1: Полный отсортированный список  ",
                                  show_index=True)
 
@@ -376,13 +458,18 @@ def main():
             # Отчет 2
             artist = input("Введите имя исполнителя для отчета: ").strip()
             if artist:
-                sorted_tracks = report_by_artist(tracks, artist)
+                from report_cache import cached_report_by_artist
+                sorted_tracks = cached_report_by_artist(tracks, artist)
                 if sorted_tracks:
                     display_tracks_table(sorted_tracks,
                                          f"ОТЧЕТ 2: {artist.upper()} ",
                                          show_index=True)
                 else:
                     print(f"Исполнитель '{artist}' не найден в медиатеке!")
+                    from search import suggest_values
+                    suggestions = suggest_values(tracks, 'artist', artist)
+                    if suggestions:
+                        print("Возможно, вы имели в виду: " + ", ".join(suggestions))
             else:
                 print("Исполнитель не указан!")
 
@@ -397,7 +484,8 @@ def main():
                     start_year, end_year = end_year, start_year
                     print(f"Диапазон автоматически изменен на {start_year}-{end_year}")
 
-                sorted_tracks = report_by_year_range(tracks, start_year, end_year)
+                from report_cache import cached_report_by_year_range
+                sorted_tracks = cached_report_by_year_range(tracks, start_year, end_year)
                 if sorted_tracks:
                     display_tracks_table(sorted_tracks,
                                          f"ОТЧЕТ 3: Годы {start_year}-{end_year} ",
@@ -427,8 +515,8 @@ def main():
             display_tracks_table(tracks, "ОБНОВЛЕННЫЙ СПИСОК", show_index=True)
 
         elif choice == "8":
-            # Сохранение данных
-            if save_tracks_to_file("tracks_data.txt", tracks):
+            # Сохранение данных (журнал изменений)
+            if journal.save(tracks):
                 print("Данные успешно сохранены!")
 
         elif choice == "9":
@@ -437,11 +525,12 @@ def main():
                 save_choice = input("\nСохранить изменения перед выходом? (да/нет): ").strip().lower()
 
                 if save_choice in ['да', 'д', 'yes', 'y']:
-                    if save_tracks_to_file("tracks_data.txt", tracks):
+                    if journal.save(tracks):
                         print("Изменения сохранены.")
                     break  # Выход из цикла проверки
 
                 elif save_choice in ['нет', 'н', 'no', 'n']:
+                    journal.discard_unsaved()
                     print("Изменения не сохранены.")
                     break  # Выход из цикла проверки
 
@@ -449,6 +538,7 @@ def main():
                     print("Ошибка: введите 'да' или 'нет'!")
                     print("Допустимые варианты: да, д, yes, y, нет, н, no, n")
 
+            journal.close()
             print("\n" + "=" * 60)
             print("Спасибо за использование Медиатеки!".center(60))
             print("=" * 60)
@@ -457,10 +547,12 @@ def main():
         else:
             print("Неверный выбор! Пожалуйста, выберите действие от 1 до 9.")
 
-        # Пауза перед следующим шагом
-        if choice != "9":
-            input("\nНажмите Enter для продолжения...")
-
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--profile' in sys.argv[1:]:
+        # Сводка профилирования всей сессии выводится после выхода из меню
+        with profiling() as profile:
+            main('--startup-time' in sys.argv[1:])
+        print(profile.summary())
+    else:
+        main('--startup-time' in sys.argv[1:])
\ No newline at end of file
@@ -1,90 +1,186 @@
-def quicksort(tracks, key_func, descending=False):
-    """Реализация сортировки Хоара"""
-    if len(tracks) <= 1:
-        return tracks.copy()
-
-    pivot = tracks[len(tracks) // 2]
-    pivot_key = key_func(pivot)
-
-    left = []
-    middle = []
-    right = []
-
-    for track in tracks:
-        track_key = key_func(track)
-        if descending:
-            if track_key > pivot_key:
-                left.append(track)
-            elif track_key < pivot_key:
-                right.append(track)
-            else:
-                middle.append(track)
-        else:
-            if track_key < pivot_key:
-                left.append(track)
-            elif track_key > pivot_key:
-                right.append(track)
-            else:
-                middle.append(track)
-
-    return quicksort(left, key_func, descending) + middle + quicksort(right, key_func, descending)
-
-
-def sort_by_multiple_keys(tracks, sort_specs):
+from external_sort import DEFAULT_MEMORY_LIMIT, external_sort
+from indexes import artist_index, normalize_artist, year_index
+from profiling import profiled
+from sorting import FieldKey, check_page, sort_by_multiple_keys
+from track_store import TrackStore, collation_key
+from views import GroupedViews, merge_views, sorted_rows
+
+
+@profiled('filter')
+def select_tracks(tracks, field, predicate):
+    """Выборка записей, у которых значение поля удовлетворяет условию"""
+    if hasattr(tracks, 'select'):
+        return tracks.select(field, predicate)
+    return [t for t in tracks if predicate(t[field])]
+
+
+# Ключи сортировки трех отчетов: первый элемент - самый значимый ключ.
+# Строки сравниваются по collation_key, ключи которых хранятся в словарях строк
+REPORT_ALL_SORT_SPECS = [
+    (FieldKey('plays'), True),  # по убыванию
+    (FieldKey('year'), True),  # по убыванию
+    (FieldKey('artist', collation_key), False)  # по возрастанию
+]
+
+REPORT_ARTIST_SORT_SPECS = [
+    (FieldKey('title', collation_key), False),  # по возрастанию
+    (FieldKey('album', collation_key), True)  # по убыванию
+]
+
+REPORT_YEAR_SORT_SPECS = [
+    (FieldKey('artist', collation_key), False),  # по возрастанию
+    (FieldKey('year'), True)  # по убыванию
+]
+
+
+# Материализованные представления отчетов для колоночного хранилища
+def all_sorted_views(store):
+    """Представление отчета 1 (одна группа - вся медиатека)"""
+    return store.get_derived('all_sorted_views', lambda s: GroupedViews(
+        s, REPORT_ALL_SORT_SPECS, lambda track: None, lambda store, group: store))
+
+
+def artist_views(store):
+    """Представления отчета 2 по исполнителям"""
+    return store.get_derived('artist_views', lambda s: GroupedViews(
+        s, REPORT_ARTIST_SORT_SPECS,
+        lambda track: normalize_artist(track['artist']),
+        lambda store, artist: artist_index(store).find(store, artist)))
+
+
+def year_views(store):
+    """Представления отчета 3 по годам выпуска"""
+    return store.get_derived('year_views', lambda s: GroupedViews(
+        s, REPORT_YEAR_SORT_SPECS,
+        lambda track: track['year'],
+        lambda store, year: year_index(store).find(store, year, year)))
+
+
+def check_report_views(store):
     """
-    Сортировка по нескольким ключам
-    sort_specs: список кортежей (ключ_функция, обратный_порядок)
+    Сверка построенных представлений и индексов хранилища (всех производных
+    структур с методом check_consistency) с построенными заново.
+    Возвращает словарь: название структуры -> список расходящихся групп.
     """
-    if not tracks:
-        return []
+    problems = {}
+    for name, derived in list(store.derived.items()):
+        check = getattr(derived, 'check_consistency', None)
+        if check is not None:
+            mismatched = check(store)
+            if mismatched:
+                problems[name] = mismatched
+    return problems
+
+
+# Движки отчетов: 'python' - сортировка Хоара и материализованные представления,
+# 'numpy' - маски отбора и np.lexsort по колонкам (требует пакет numpy)
+BACKENDS = ('python', 'numpy')
+
+
+def _check_backend(backend, limit=None, offset=0):
+    """Проверка движка и страницы отчета; True - движок numpy"""
+    check_page(limit, offset)
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный движок отчетов: {backend}")
+    return backend == 'numpy'
 
-    sorted_tracks = tracks.copy()
-    for key_func, reverse in reversed(sort_specs):
-        sorted_tracks = quicksort(sorted_tracks, key_func, reverse)
 
-    return sorted_tracks
+def _numpy_engine():
+    """Движок numpy импортируется при первом отчете с backend='numpy', а не при запуске"""
+    import numpy_engine
+    return numpy_engine
 
 
 # Функции для трех отчетов по заданию
-def report_all_sorted(tracks):
+# limit, offset - страница результата (по умолчанию весь список); первая страница
+# выбирается частичным выбором за O(n log k) без полной сортировки
+@profiled('report.all')
+def report_all_sorted(tracks, limit=None, offset=0, backend='python'):
     """
     Отчет 1: Список всех аудиозаписей, отсортированный по:
     исполнитель (по возрастанию) + год выпуска (по убыванию) +
     количество прослушиваний (по убыванию)
     """
-    sort_specs = [
-        (lambda x: x['plays'], True),  # по убыванию
-        (lambda x: x['year'], True),  # по убыванию
-        (lambda x: x['artist'].lower(), False)  # по возрастанию
-    ]
-    return sort_by_multiple_keys(tracks, sort_specs)
+    if _check_backend(backend, limit, offset):
+        return _numpy_engine().sort_tracks(tracks, REPORT_ALL_SORT_SPECS, None, limit, offset)
+    if isinstance(tracks, TrackStore):
+        return all_sorted_views(tracks).rows(tracks, None, limit, offset)
+    return sort_by_multiple_keys(tracks, REPORT_ALL_SORT_SPECS, limit=limit, offset=offset)
 
 
-def report_by_artist(tracks, artist_name):
+@profiled('report.artist')
+def report_by_artist(tracks, artist_name, limit=None, offset=0, backend='python'):
     """
     Отчет 2: Список всех аудиозаписей конкретного исполнителя,
     отсортированный по: альбом (по убыванию) + название трека (по возрастанию)
     """
-    artist_tracks = [t for t in tracks if t['artist'].lower() == artist_name.lower()]
-
-    sort_specs = [
-        (lambda x: x['title'].lower(), False),  # по возрастанию
-        (lambda x: x['album'].lower(), True)  # по убыванию
-    ]
-
-    return sort_by_multiple_keys(artist_tracks, sort_specs)
-
-
-def report_by_year_range(tracks, start_year, end_year):
+    if _check_backend(backend, limit, offset):
+        artist_name = normalize_artist(artist_name)
+        return _numpy_engine().sort_tracks(
+            tracks, REPORT_ARTIST_SORT_SPECS,
+            lambda columns: columns.string_mask(
+                'artist', lambda artist: normalize_artist(artist) == artist_name),
+            limit, offset)
+    if isinstance(tracks, TrackStore):
+        return artist_views(tracks).rows(tracks, normalize_artist(artist_name), limit, offset)
+
+    artist_name = normalize_artist(artist_name)
+    artist_tracks = select_tracks(tracks, 'artist',
+                                  lambda artist: normalize_artist(artist) == artist_name)
+    return sort_by_multiple_keys(artist_tracks, REPORT_ARTIST_SORT_SPECS,
+                                 limit=limit, offset=offset)
+
+
+@profiled('report.years')
+def report_by_year_range(tracks, start_year, end_year, limit=None, offset=0, backend='python'):
     """
     Отчет 3: Список всех аудиозаписей, выпущенных в период с N1 до N2 года,
     отсортированный по: год выпуска (по убыванию) + исполнитель (по возрастанию)
     """
-    filtered_tracks = [t for t in tracks if start_year <= t['year'] <= end_year]
-
-    sort_specs = [
-        (lambda x: x['artist'].lower(), False),  # по возрастанию
-        (lambda x: x['year'], True)  # по убыванию
-    ]
-
-    return sort_by_multiple_keys(filtered_tracks, sort_specs)
\ No newline at end of file
+    if _check_backend(backend, limit, offset):
+        return _numpy_engine().sort_tracks(
+            tracks, REPORT_YEAR_SORT_SPECS,
+            lambda columns: columns.range_mask('year', start_year, end_year),
+            limit, offset)
+    if isinstance(tracks, TrackStore):
+        views = year_views(tracks)
+        years = year_index(tracks).years_between(start_year, end_year)
+        if limit is None or all(views.has_view(year) for year in years):
+            return merge_views(tracks, [views.view(tracks, year) for year in years],
+                               limit, offset)
+        return sorted_rows(year_index(tracks).find(tracks, start_year, end_year),
+                           REPORT_YEAR_SORT_SPECS, limit, offset)
+
+    filtered_tracks = select_tracks(tracks, 'year',
+                                    lambda year: start_year <= year <= end_year)
+    return sort_by_multiple_keys(filtered_tracks, REPORT_YEAR_SORT_SPECS,
+                                 limit=limit, offset=offset)
+
+
+# Отчеты по потоку записей (например, loader.iter_tracks) без загрузки всей медиатеки
+def report_by_artist_stream(track_stream, artist_name):
+    """Отчет 2 по потоку записей: в памяти остаются только записи исполнителя"""
+    artist_name = normalize_artist(artist_name)
+    artist_tracks = [t for t in track_stream if normalize_artist(t['artist']) == artist_name]
+    return sort_by_multiple_keys(artist_tracks, REPORT_ARTIST_SORT_SPECS)
+
+
+def report_by_year_range_stream(track_stream, start_year, end_year):
+    """Отчет 3 по потоку записей: фильтрация по году выполняется во время чтения"""
+    filtered_tracks = [t for t in track_stream if start_year <= t['year'] <= end_year]
+    return sort_by_multiple_keys(filtered_tracks, REPORT_YEAR_SORT_SPECS)
+
+
+# Отчеты по потоку записей с внешней сортировкой: память ограничена memory_limit
+# независимо от размера медиатеки, результат - генератор записей
+def report_all_sorted_external(track_stream, memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None):
+    """Отчет 1 по потоку записей (например, loader.iter_tracks) через временные файлы"""
+    return external_sort(track_stream, REPORT_ALL_SORT_SPECS, memory_limit, temp_dir=temp_dir)
+
+
+def report_by_year_range_external(track_stream, start_year, end_year,
+                                  memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None):
+    """Отчет 3 по потоку записей через временные файлы"""
+    filtered_tracks = (t for t in track_stream if start_year <= t['year'] <= end_year)
+    return external_sort(filtered_tracks, REPORT_YEAR_SORT_SPECS, memory_limit,
+                         temp_dir=temp_dir)
\ No newline at end of file
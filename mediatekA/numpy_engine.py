@@ -0,0 +1,173 @@
+from array import array
+
+from profiling import profiled
+from sorting import FieldKey, check_page
+from track_store import TrackStore, TrackView, collation_key
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него доступен только движок на Python
+    np = None
+
+
+def numpy_available():
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Для движка 'numpy' требуется установить пакет numpy")
+
+
+def _index_array(row_ids):
+    """
+    Копия номеров строк в массиве NumPy (копируется буфер целиком: массив
+    хранилища, пока на него есть ссылка из NumPy, нельзя изменять в размере)
+    """
+    if isinstance(row_ids, range):
+        return np.arange(row_ids.start, row_ids.stop, row_ids.step, dtype=np.int64)
+    return np.array(row_ids, dtype=np.int64)
+
+
+class NumpyColumns:
+    """
+    Колонки записей хранилища в массивах NumPy (по порядку row_ids).
+    Строковые поля хранятся номерами строк словаря; таблицы рангов
+    нормализованных строк строятся один раз на поле и нормализацию.
+    Снимок соответствует версии хранилища generation.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.generation = store.generation
+        self.row_ids = _index_array(store.row_ids)
+        self.columns = {field: np.asarray(column)[self.row_ids]
+                        for field, column in store.columns.items()}
+        self.rank_tables = {}
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def values(self, field):
+        return self.columns[field]
+
+    def string_ranks(self, field, normalize=None):
+        """Ранги (нормализованных) строк словаря поля в порядке возрастания"""
+        table = self.rank_tables.get((field, normalize))
+        if table is None:
+            strings = self._pool_values(field, normalize)
+            ranks = {value: rank for rank, value in enumerate(sorted(set(strings)))}
+            table = np.fromiter((ranks[string] for string in strings), dtype=np.int64,
+                                count=len(strings))
+            self.rank_tables[field, normalize] = table
+        return table
+
+    def string_mask(self, field, predicate):
+        """Маска записей, у которых строка поля удовлетворяет условию (проверка по словарю)"""
+        matched = np.fromiter((bool(predicate(string))
+                               for string in self.store.pools[field].strings),
+                              dtype=bool, count=len(self.store.pools[field]))
+        return matched[self.columns[field]]
+
+    def range_mask(self, field, low, high):
+        """Маска записей со значением числового поля в диапазоне [low, high]"""
+        values = self.columns[field]
+        return (values >= low) & (values <= high)
+
+    def key_codes(self, key_func, reverse, positions):
+        """
+        Целые коды ключа для записей positions, сохраняющие порядок ключа;
+        убывание получается сменой знака кода.
+        """
+        if isinstance(key_func, FieldKey) and key_func.field in self.columns:
+            field = key_func.field
+            if field in self.store.pools:
+                codes = self._string_codes(field, key_func.normalize, positions)
+            elif key_func.normalize is None:
+                codes = self.columns[field][positions].astype(np.int64)
+            else:
+                codes = self._rank_values(
+                    [key_func.normalize(value) for value in self.columns[field][positions].tolist()])
+        else:
+            rows = self.row_ids[positions].tolist()
+            codes = self._rank_values([key_func(self.store.row(row_id)) for row_id in rows])
+        return -codes if reverse else codes
+
+    def _string_codes(self, field, normalize, positions):
+        """
+        Ранги строк поля для записей positions. Для небольшой выборки
+        ранжируются только ее различные строки, а не весь словарь поля.
+        """
+        string_ids = self.columns[field][positions]
+        if (field, normalize) in self.rank_tables or len(positions) >= len(self.store.pools[field]):
+            return self.string_ranks(field, normalize)[string_ids]
+        distinct_ids, inverse = np.unique(string_ids, return_inverse=True)
+        if normalize is collation_key:
+            strings, normalize = self.store.pools[field].collation_keys(), None
+        else:
+            strings = self.store.pools[field].strings
+        values = [strings[string_id] for string_id in distinct_ids.tolist()]
+        if normalize is not None:
+            values = [normalize(value) for value in values]
+        return self._rank_values(values)[inverse]
+
+    def _pool_values(self, field, normalize):
+        """Строки словаря поля; для collation_key - готовые ключи сравнения словаря"""
+        pool = self.store.pools[field]
+        if normalize is collation_key:
+            return pool.collation_keys()
+        if normalize is None:
+            return pool.strings
+        return [normalize(string) for string in pool.strings]
+
+    @staticmethod
+    def _rank_values(values):
+        ranks = {value: rank for rank, value in enumerate(sorted(set(values)))}
+        return np.fromiter((ranks[value] for value in values), dtype=np.int64, count=len(values))
+
+
+def numpy_columns(store):
+    """Колонки NumPy хранилища; пересоздаются после любого изменения"""
+    _require_numpy()
+    columns = store.derived.get('numpy_columns')
+    if columns is None or columns.generation != store.generation:
+        columns = store.derived['numpy_columns'] = NumpyColumns(store)
+    return columns
+
+
+@profiled('sort')
+def sorted_positions(columns, sort_specs, positions=None):
+    """
+    Позиции записей в порядке сортировки по нескольким ключам
+    (первый элемент sort_specs - самый значимый ключ).
+    np.lexsort устойчив, поэтому равные записи сохраняют исходный порядок,
+    как в сортировке по упакованным ключам.
+    """
+    if positions is None:
+        positions = np.arange(len(columns), dtype=np.int64)
+    if not len(positions):
+        return positions
+    keys = [columns.key_codes(key_func, reverse, positions)
+            for key_func, reverse in reversed(sort_specs)]
+    return positions[np.lexsort(keys)]
+
+
+def sort_tracks(tracks, sort_specs, mask=None, limit=None, offset=0):
+    """
+    Выборка и сортировка записей движком NumPy.
+    mask(columns) - необязательная маска отбора записей (логический массив).
+    Для хранилища возвращается TrackView, для списка - список записей.
+    """
+    check_page(limit, offset)
+    _require_numpy()
+    store = tracks if isinstance(tracks, TrackStore) else TrackStore(tracks)
+    columns = numpy_columns(store)
+
+    positions = None if mask is None else np.flatnonzero(mask(columns))
+    order = sorted_positions(columns, sort_specs, positions)
+    order = order[offset:None if limit is None else offset + limit]
+    if store is not tracks:
+        return [tracks[position] for position in order.tolist()]
+    row_ids = array('q')
+    row_ids.frombytes(columns.row_ids[order].astype(np.int64).tobytes())
+    return TrackView(store, row_ids)
@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Встроенное профилирование горячих участков.
+# Включается только внутри блока `with profiling() as profile:`; вне его
+# проверки стоят одно сравнение с None на вызов функции (не на запись),
+# поэтому инструментирование можно не убирать из рабочего кода.
+
+current = None  # активный Profile или None
+_NO_PHASE = nullcontext()
+
+
+class Profile:
+    """Счетчики событий и суммарное время этапов (вызовы и секунды)"""
+
+    def __init__(self):
+        self.counters = {}
+        self.maxima = {}
+        self.phases = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def maximum(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    def add_time(self, name, seconds):
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """Итератор, время получения каждого элемента которого относится к этапу name"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def as_dict(self):
+        return {
+            'phases': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.phases.items()},
+            'counters': dict(self.counters),
+            'maxima': dict(self.maxima),
+        }
+
+    def summary(self):
+        """Текстовая сводка: этапы по убыванию времени, затем счетчики"""
+        lines = [f"{'Этап':24} | {'Вызовов':>9} | {'Всего, с':>10} | {'Среднее, мс':>11}",
+                 "-" * 64]
+        for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:24} | {calls:9} | {seconds:10.4f} | {seconds / calls * 1000:11.3f}")
+        if self.counters or self.maxima:
+            lines.append("")
+            lines.append(f"{'Счетчик':24} | {'Значение':>15}")
+            lines.append("-" * 42)
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:24} | {value:15,}")
+            for name, value in sorted(self.maxima.items()):
+                lines.append(f"{name:24} | {value:15,}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling(profile=None):
+    """Включение профилирования на время блока; возвращает Profile со сводкой"""
+    global current
+    previous = current
+    current = Profile() if profile is None else profile
+    try:
+        yield current
+    finally:
+        current = previous
+
+
+def phase(name):
+    """Контекст замера этапа name (ничего не делает, если профилирование выключено)"""
+    if current is None:
+        return _NO_PHASE
+    return current.phase(name)
+
+
+def profiled(name):
+    """Декоратор: время каждого вызова функции относится к этапу name"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current is None:
+                return func(*args, **kwargs)
+            with current.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
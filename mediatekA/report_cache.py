@@ -0,0 +1,114 @@
+import sys
+from collections import OrderedDict
+
+from indexes import normalize_artist
+from media_logic import report_all_sorted, report_by_artist, report_by_year_range
+from track_store import TrackView
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ROW_ID_BYTES = 8 + 28  # ссылка в кортеже и объект int номера строки
+
+
+def result_size(count):
+    """Приблизительный объем памяти кешированного результата из count записей"""
+    return sys.getsizeof(()) + count * ROW_ID_BYTES
+
+
+class ReportCache:
+    """
+    LRU-кеш результатов отчетов, ограниченный по памяти.
+    Ключ включает версию хранилища (generation), поэтому после любого
+    изменения медиатеки или новой загрузки старые результаты не используются
+    и со временем вытесняются. Хранятся только кортежи номеров строк: пока
+    версия хранилища та же, записи читаются из него же (TrackView).
+    Результат, который не поместился бы в кеш, возвращается без сохранения.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Результат из кеша или вычисленный compute() (выборка хранилища
+        TrackView) и сохраненный в кеш
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            store, row_ids, _ = entry
+            return TrackView(store, row_ids)
+
+        self.misses += 1
+        result = compute()
+        if not isinstance(result, TrackView):
+            return result
+        size = result_size(len(result))
+        if size <= self.max_bytes:
+            row_ids = tuple(result.row_ids)
+            self.entries[key] = (result.store, row_ids, size)
+            self.current_bytes += size
+            self._evict()
+            return TrackView(result.store, row_ids)
+        return result
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes:
+            _, (_, _, size) = self.entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        """Статистика попаданий, промахов и вытеснений"""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+default_cache = ReportCache()
+
+
+def _cached(cache, tracks, key, compute):
+    """Кешируются только отчеты по хранилищу с номером версии"""
+    generation = getattr(tracks, 'generation', None)
+    if generation is None:
+        return compute()
+    if cache is None:
+        cache = default_cache
+    return cache.get_or_compute(key + (generation,), compute)
+
+
+# Движок отчета не входит в ключ: результаты движков совпадают
+def cached_report_all_sorted(tracks, cache=None, limit=None, offset=0, backend='python'):
+    """Отчет 1 через кеш"""
+    return _cached(cache, tracks, ('all', limit, offset),
+                   lambda: report_all_sorted(tracks, limit, offset, backend))
+
+
+def cached_report_by_artist(tracks, artist_name, cache=None, limit=None, offset=0,
+                            backend='python'):
+    """Отчет 2 через кеш"""
+    return _cached(cache, tracks, ('artist', normalize_artist(artist_name), limit, offset),
+                   lambda: report_by_artist(tracks, artist_name, limit, offset, backend))
+
+
+def cached_report_by_year_range(tracks, start_year, end_year, cache=None, limit=None, offset=0,
+                                backend='python'):
+    """Отчет 3 через кеш"""
+    return _cached(cache, tracks, ('years', int(start_year), int(end_year), limit, offset),
+                   lambda: report_by_year_range(tracks, start_year, end_year, limit, offset,
+                                                backend))
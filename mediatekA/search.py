@@ -0,0 +1,238 @@
+import re
+from array import array
+from bisect import bisect_left, insort
+
+from indexes import mismatched_keys
+from media_logic import REPORT_ALL_SORT_SPECS, all_sorted_views, sort_by_multiple_keys
+from profiling import profiled
+from track_store import (STRING_FIELDS, StoreListener, TrackStore, TrackView, changed_rows,
+                         collation_key)
+from views import sorted_rows
+
+# Поиск по словам исполнителя, названия и альбома, например:
+#   search_tracks(tracks, "ed shee")  - записи, где есть слова на "ed" и на "shee"
+# Каждое слово запроса должно найтись хотя бы в одном из полей; результаты
+# упорядочены как в отчете 1: по убыванию прослушиваний, затем года, затем
+# по исполнителю.
+
+SEARCH_MODES = ('exact', 'prefix', 'substring')
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Различные слова строки без учета регистра в порядке появления"""
+    return tuple(dict.fromkeys(_WORD.findall(collation_key(text))))
+
+
+def _matches(token, term, mode):
+    if mode == 'prefix':
+        return token.startswith(term)
+    if mode == 'substring':
+        return term in token
+    return token == term
+
+
+def _remove_sorted(values, value):
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+
+
+class SearchIndex(StoreListener):
+    """
+    Поисковый индекс хранилища по строковым полям.
+    Для каждого поля: обратный индекс слово -> отсортированные номера строк
+    и отсортированный словарь слов (поиск по началу слова - двоичным поиском,
+    по подстроке - проходом по различным словам, а не по записям).
+    Слова строк словаря (StringPool) выделяются один раз на строку,
+    поэтому повторяющиеся исполнители и альбомы не разбираются заново.
+    """
+
+    def __init__(self, store, fields=STRING_FIELDS):
+        self.fields = tuple(fields)
+        self.postings = {}
+        self.vocabulary = {}
+        self.string_tokens = {}
+        for field in self.fields:
+            tokens_by_string = [tokenize(string) for string in store.pools[field].strings]
+            postings = {}
+            column = store.columns[field]
+            for row_id in store.row_ids:
+                for token in tokens_by_string[column[row_id]]:
+                    row_ids = postings.get(token)
+                    if row_ids is None:
+                        postings[token] = [row_id]
+                    else:
+                        row_ids.append(row_id)
+            self.postings[field] = postings
+            self.vocabulary[field] = sorted(postings)
+            self.string_tokens[field] = tokens_by_string
+
+    def _tokens(self, store, field, row_id):
+        """Слова поля записи (слова новых строк словаря выделяются при первом обращении)"""
+        tokens_by_string = self.string_tokens[field]
+        strings = store.pools[field].strings
+        if len(tokens_by_string) < len(strings):
+            tokens_by_string.extend(tokenize(string)
+                                    for string in strings[len(tokens_by_string):])
+        return tokens_by_string[store.columns[field][row_id]]
+
+    # Поиск
+    def words(self, field, term, mode='prefix'):
+        """Слова словаря поля, подходящие под слово запроса"""
+        vocabulary = self.vocabulary[field]
+        if mode == 'substring':
+            return [token for token in vocabulary if term in token]
+        position = bisect_left(vocabulary, term)
+        if mode == 'exact':
+            return vocabulary[position:position + 1] if (
+                position < len(vocabulary) and vocabulary[position] == term) else []
+        end = position
+        while end < len(vocabulary) and vocabulary[end].startswith(term):
+            end += 1
+        return vocabulary[position:end]
+
+    def term_words(self, term, mode='prefix', fields=None):
+        """Подходящие под слово запроса слова по полям: [(поле, множество слов)]"""
+        return [(field, set(self.words(field, term, mode))) for field in fields or self.fields]
+
+    def _row_has(self, store, row_id, term_words):
+        return any(words and not words.isdisjoint(self._tokens(store, field, row_id))
+                   for field, words in term_words)
+
+    @profiled('search')
+    def find(self, store, query, mode='prefix', fields=None, limit=None):
+        """
+        Записи, содержащие все слова запроса, в порядке отчета 1 (по убыванию
+        прослушиваний). Если подходит большая часть медиатеки и нужны только
+        первые limit записей, просматривается готовое представление отчета 1
+        до limit найденных; иначе кандидаты берутся из обратного индекса по
+        самому редкому слову запроса, остальные слова проверяются по словам
+        самих кандидатов.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        terms = [self.term_words(term, mode, fields) for term in tokenize(query)]
+        if not terms:
+            return TrackView(store, array('q'))
+        sizes = [sum(len(self.postings[field][token]) for field, words in term_words
+                     for token in words)
+                 for term_words in terms]
+        rarest = min(range(len(terms)), key=sizes.__getitem__)
+        if not sizes[rarest]:
+            return TrackView(store, array('q'))
+
+        # Ожидаемая длина просмотра представления - limit * N / число совпадений
+        if limit is not None and limit * len(store) < sizes[rarest] ** 2:
+            found = array('q')
+            if limit:
+                for row_id in all_sorted_views(store).view(store, None).rows:
+                    if all(self._row_has(store, row_id, term_words) for term_words in terms):
+                        found.append(row_id)
+                        if len(found) == limit:
+                            break
+            return TrackView(store, found)
+
+        rows = set()
+        for field, words in terms.pop(rarest):
+            for token in words:
+                rows.update(self.postings[field][token])
+        rows = sorted(rows)
+        if terms:
+            rows = [row_id for row_id in rows
+                    if all(self._row_has(store, row_id, term_words) for term_words in terms)]
+        return sorted_rows(TrackView(store, array('q', rows)), REPORT_ALL_SORT_SPECS, limit)
+
+    # Обновление при изменениях хранилища
+    def _add(self, field, tokens, row_id):
+        postings = self.postings[field]
+        for token in tokens:
+            row_ids = postings.get(token)
+            if row_ids is None:
+                postings[token] = [row_id]
+                insort(self.vocabulary[field], token)
+            elif row_ids[-1] < row_id:
+                row_ids.append(row_id)
+            else:
+                insort(row_ids, row_id)
+
+    def _remove(self, field, tokens, row_id):
+        postings = self.postings[field]
+        for token in tokens:
+            row_ids = postings.get(token)
+            if row_ids is not None:
+                _remove_sorted(row_ids, row_id)
+                if not row_ids:
+                    del postings[token]
+                    _remove_sorted(self.vocabulary[field], token)
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            for field in self.fields:
+                self._add(field, self._tokens(store, field, row_id), row_id)
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            for field in self.fields:
+                self._remove(field, self._tokens(store, field, row_id), row_id)
+
+    def rows_changed(self, store, changes):
+        # Изменения группируются по записям: при нескольких изменениях поля
+        # в одном пакете слова удаляются по исходному значению, а добавляются по итоговому
+        changes = [change for change in changes if change[1] in self.postings]
+        for row_id, old_track, new_track in changed_rows(store, changes):
+            for field in self.fields:
+                if old_track[field] != new_track[field]:
+                    self._remove(field, tokenize(old_track[field]), row_id)
+                    self._add(field, self._tokens(store, field, row_id), row_id)
+
+    def check_consistency(self, store):
+        """Пары (поле, слово), расходящиеся с заново построенным индексом"""
+        expected = SearchIndex(store, self.fields)
+        mismatched = []
+        for field in self.fields:
+            tokens = mismatched_keys(self.postings[field], expected.postings[field])
+            if not tokens and self.vocabulary[field] != expected.vocabulary[field]:
+                tokens = expected.vocabulary[field]  # словарь слов не отсортирован или с повторами
+            mismatched.extend((field, token) for token in tokens)
+        return mismatched
+
+
+def search_index(store):
+    """Поисковый индекс хранилища (строится при первом обращении)"""
+    return store.get_derived('search_index', SearchIndex)
+
+
+def search_tracks(tracks, query, mode='prefix', fields=None, limit=None):
+    """
+    Поиск записей по словам запроса в полях fields (по умолчанию исполнитель,
+    название и альбом); mode: 'exact' - слово целиком, 'prefix' - начало
+    слова, 'substring' - часть слова. Результат - в порядке отчета 1 (по убыванию прослушиваний).
+    Для хранилища используется поддерживаемый индекс, для списка - проход по записям.
+    """
+    if isinstance(tracks, TrackStore):
+        return search_index(tracks).find(tracks, query, mode, fields, limit)
+
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Неизвестный режим поиска: {mode}")
+    terms = tokenize(query)
+    if not terms:
+        return []
+    fields = fields or STRING_FIELDS
+    found = [track for track in tracks
+             if all(any(_matches(token, term, mode)
+                        for field in fields for token in tokenize(track[field]))
+                    for term in terms)]
+    return sort_by_multiple_keys(found, REPORT_ALL_SORT_SPECS, limit=limit)
+
+
+def suggest_values(tracks, field, query, limit=10):
+    """Различные значения поля, подходящие под запрос (по началу слов), - подсказки"""
+    values = []
+    for track in search_tracks(tracks, query, 'prefix', (field,)):
+        value = track[field]
+        if value not in values:
+            values.append(value)
+            if len(values) == limit:
+                break
+    return values
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import json
+import signal
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from cli import apply_change
+from journal import load_with_journal
+from media_logic import BACKENDS
+from report_cache import (ReportCache, cached_report_all_sorted, cached_report_by_artist,
+                          cached_report_by_year_range)
+from sorting import check_page
+from track_store import FIELDS
+
+# Протокол: по одному объекту JSON в строке в обе стороны.
+# Запрос: {"id": <любое значение>, "op": <операция>, ...параметры}
+#   report_all    [limit, offset, backend]
+#   report_artist artist [limit, offset, backend]
+#   report_years  start, end [limit, offset, backend]
+#   add / edit / delete - как в файле изменений cli.py (позиции с 1 или "track_id")
+#   save, stats
+# Ответ: {"id": ..., "ok": true, ...} или {"id": ..., "ok": false, "error": "..."}
+# Записи отчетов содержат постоянный идентификатор "track_id" для edit/delete.
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+READ_OPERATIONS = ('report_all', 'report_artist', 'report_years', 'stats')
+WRITE_OPERATIONS = ('add', 'edit', 'delete', 'save')
+MAX_LINE = 1024 * 1024
+
+
+class ReadWriteLock:
+    """
+    Блокировка для корутин: чтения выполняются одновременно, запись - одна
+    и без чтений. Ожидающая запись задерживает новые чтения, чтобы поток
+    отчетов не откладывал изменения бесконечно.
+    """
+
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    async def acquire_read(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writing and not self.writers_waiting)
+            self.readers += 1
+
+    async def release_read(self):
+        async with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    async def acquire_write(self):
+        async with self.condition:
+            self.writers_waiting += 1
+            try:
+                await self.condition.wait_for(lambda: not self.writing and not self.readers)
+            finally:
+                self.writers_waiting -= 1
+            self.writing = True
+
+    async def release_write(self):
+        async with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+
+class RequestError(Exception):
+    """Некорректный запрос клиента"""
+
+
+def _page(request):
+    limit = request.get('limit')
+    offset = request.get('offset', 0)
+    try:
+        check_page(limit, offset)
+    except ValueError as e:
+        raise RequestError(str(e)) from None
+    return limit, offset
+
+
+def _year(request, name):
+    value = request.get(name)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RequestError(f"{name} должен быть целым числом")
+    return value
+
+
+class ReportServer:
+    """
+    Сервер отчетов над одной загруженной медиатекой.
+    Изменения выполняются по одному под блокировкой записи; отчеты -
+    под блокировкой чтения, поэтому каждый отчет строится по согласованной
+    версии хранилища. Построение отчета и кодирование ответа выполняются
+    в отдельном потоке, чтобы цикл событий продолжал обслуживать клиентов.
+    Поток один: представления отчетов и кеш строятся лениво и не рассчитаны
+    на одновременное изменение из нескольких потоков.
+    """
+
+    def __init__(self, tracks, journal=None, cache=None):
+        self.tracks = tracks
+        self.journal = journal
+        self.cache = ReportCache() if cache is None else cache
+        self.lock = ReadWriteLock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reports')
+        self.connections = {}  # задача обработки клиента -> поток записи
+
+    # Чтение
+    def _report(self, request):
+        """Построение отчета (выполняется в потоке исполнителя); возвращает ответ"""
+        operation = request['op']
+        if operation == 'stats':
+            return {'tracks': len(self.tracks), 'generation': self.tracks.generation,
+                    'clients': len(self.connections), 'cache': self.cache.stats()}
+
+        limit, offset = _page(request)
+        backend = request.get('backend', 'python')
+        if backend not in BACKENDS:
+            raise RequestError(f"неизвестный движок отчетов: {backend}")
+        if operation == 'report_all':
+            report = cached_report_all_sorted(self.tracks, self.cache, limit, offset, backend)
+        elif operation == 'report_artist':
+            artist = request.get('artist')
+            if not isinstance(artist, str) or not artist.strip():
+                raise RequestError("не указан исполнитель")
+            report = cached_report_by_artist(self.tracks, artist.strip(), self.cache,
+                                             limit, offset, backend)
+        else:
+            start_year, end_year = _year(request, 'start'), _year(request, 'end')
+            if start_year > end_year:
+                start_year, end_year = end_year, start_year
+            report = cached_report_by_year_range(self.tracks, start_year, end_year, self.cache,
+                                                 limit, offset, backend)
+        return {'generation': self.tracks.generation, 'count': len(report),
+                'tracks': [{'track_id': track.track_id, **{field: track[field] for field in FIELDS}}
+                           for track in report]}
+
+    def _encode_report(self, request):
+        return _encode({'id': request.get('id'), 'ok': True, **self._report(request)})
+
+    async def read(self, request):
+        await self.lock.acquire_read()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._encode_report, request)
+        finally:
+            await self.lock.release_read()
+
+    # Запись
+    def _mutate(self, request):
+        if request['op'] == 'save':
+            if self.journal is None or not self.journal.save(self.tracks):
+                raise RequestError("изменения не сохранены")
+        else:
+            try:
+                apply_change(self.tracks, request)
+            except (KeyError, TypeError, ValueError) as e:
+                raise RequestError(str(e))
+        return {'tracks': len(self.tracks), 'generation': self.tracks.generation}
+
+    async def write(self, request):
+        await self.lock.acquire_write()
+        try:
+            if request['op'] == 'save':
+                # Сохранение может сжать журнал и переписать всю медиатеку:
+                # выполняется в потоке, цикл событий продолжает обслуживать клиентов
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(self.executor, self._mutate, request)
+            else:
+                response = self._mutate(request)
+            return _encode({'id': request.get('id'), 'ok': True, **response})
+        finally:
+            await self.lock.release_write()
+
+    # Соединения
+    async def handle_request(self, line):
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("ожидается объект JSON")
+            operation = request.get('op')
+            if operation in READ_OPERATIONS:
+                return await self.read(request)
+            if operation in WRITE_OPERATIONS:
+                return await self.write(request)
+            raise RequestError(f"неизвестная операция: {operation}")
+        except (RequestError, ValueError, ImportError) as e:
+            # ImportError - движок 'numpy' без установленного пакета numpy
+            return _encode({'id': _request_id(request), 'ok': False, 'error': str(e)})
+        except Exception:
+            # Ошибка сервера не должна обрывать соединение клиента без ответа
+            print(f"Ошибка при обработке запроса {line[:200]!r}:")
+            traceback.print_exc()
+            return _encode({'id': _request_id(request), 'ok': False,
+                            'error': "внутренняя ошибка сервера"})
+
+    async def handle_client(self, reader, writer):
+        """Запросы клиента обрабатываются по порядку, ответы идут в том же порядке"""
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(_encode({'id': None, 'ok': False, 'error': "слишком длинный запрос"}))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(await self.handle_request(line))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Запуск сервера; возвращает asyncio.Server (port=0 - любой свободный порт)"""
+        return await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE)
+
+    async def close_connections(self):
+        """Закрытие соединений клиентов: обработчики завершаются после текущего запроса"""
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def _request_id(request):
+    return request.get('id') if isinstance(request, dict) else None
+
+
+def _encode(response):
+    return (json.dumps(response, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+async def serve(filename, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    tracks, journal = load_with_journal(filename)
+    if not tracks:
+        print(f"Невозможно загрузить данные! Проверьте файл {filename}")
+        return
+    report_server = ReportServer(tracks, journal)
+    try:
+        server = await report_server.start(host, port)
+    except OSError as e:
+        print(f"Ошибка при запуске сервера: {e}")
+        report_server.close()
+        journal.close()
+        return
+    print(f"Сервер медиатеки слушает {host}:{port}")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stopped.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка по KeyboardInterrupt
+    try:
+        async with server:
+            await stopped.wait()
+            await report_server.close_connections()
+        print("Сервер остановлен")
+    finally:
+        report_server.close()
+        # Изменения клиентов уже записаны в журнал; при остановке они фиксируются
+        journal.save(tracks)
+        journal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер отчетов медиатеки (JSON по строкам)")
+    parser.add_argument('--data', default='tracks_data.txt', help="Файл медиатеки")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.data, args.host, args.port))
+    except KeyboardInterrupt:
+        print("Сервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from track_store import STRING_FIELDS, StringPool, TrackStore, TrackView
+
+# Формат снимка (все числа little-endian, разделы выровнены на 8 байт):
+#   заголовок HEADER;
+#   постоянные идентификаторы записей (int64, с версии схемы 2);
+#   колонки year (int32), duration (int32), plays (int64);
+#   колонки номеров строк artist, title, album (uint32);
+#   для каждого строкового поля: смещения строк (uint64, count + 1) и байты UTF-8.
+MAGIC = b'MTKSNAP\x00'
+SCHEMA_VERSION = 2
+READABLE_VERSIONS = (1, 2)  # снимки версии 1 - без идентификаторов
+HEADER = struct.Struct('<8sIIQ3Q3Q')
+SNAPSHOT_EXTENSION = '.mtks'
+NUMERIC_LAYOUT = (('year', 'i'), ('duration', 'i'), ('plays', 'q'))
+
+
+class SnapshotError(ValueError):
+    """Файл не является корректным снимком медиатеки"""
+
+
+class MappedStrings:
+    """Таблица строк снимка: строки декодируются из отображенной памяти при обращении"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, string_id):
+        return str(self.blob[self.offsets[string_id]:self.offsets[string_id + 1]], 'utf-8')
+
+    def __iter__(self):
+        for string_id in range(len(self)):
+            yield self[string_id]
+
+
+def is_snapshot(filename):
+    """Проверка сигнатуры снимка в начале файла"""
+    try:
+        with open(filename, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def _little_endian(values):
+    """Массив в порядке байтов little-endian"""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def write_snapshot(filename, tracks):
+    """
+    Запись медиатеки в бинарный снимок.
+    Файл пишется во временный и атомарно заменяет прежний: старый снимок
+    может быть отображен в память открытым хранилищем.
+    """
+    if isinstance(tracks, TrackView):
+        store = tracks.store
+        row_ids = tracks.row_ids
+    else:
+        store = TrackStore(tracks)
+        row_ids = store.row_ids
+    sections = [_little_endian(array('q', [store.ids[row_id] for row_id in row_ids]))]
+    for field, typecode in NUMERIC_LAYOUT:
+        column = store.columns[field]
+        sections.append(_little_endian(array(typecode, [column[row_id] for row_id in row_ids])))
+    for field in STRING_FIELDS:
+        column = store.columns[field]
+        sections.append(_little_endian(array('I', [column[row_id] for row_id in row_ids])))
+
+    string_counts = []
+    blob_sizes = []
+    for field in STRING_FIELDS:
+        encoded = [string.encode('utf-8') for string in store.pools[field].strings]
+        offsets = array('Q', accumulate((len(data) for data in encoded), initial=0))
+        blob = b''.join(encoded)
+        string_counts.append(len(encoded))
+        blob_sizes.append(len(blob))
+        sections.append(_little_endian(offsets))
+        sections.append(blob)
+
+    checksum = 0
+    body = []
+    for section in sections:
+        data = section.tobytes() if isinstance(section, array) else section
+        data += _padding(len(data))
+        checksum = zlib.crc32(data, checksum)
+        body.append(data)
+
+    header = HEADER.pack(MAGIC, SCHEMA_VERSION, checksum, len(row_ids),
+                         *string_counts, *blob_sizes)
+    temp_name = filename + '.tmp'
+    with open(temp_name, 'wb') as file:
+        file.write(header)
+        for data in body:
+            file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_name, filename)
+
+
+def open_snapshot(filename, verify=False):
+    """
+    Открытие снимка через mmap без копирования: колонки хранилища являются
+    memoryview над отображенным файлом, строки декодируются по требованию.
+    verify=True дополнительно сверяет контрольную сумму (читает весь файл).
+    """
+    with open(filename, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapping) < HEADER.size:
+        raise SnapshotError("файл короче заголовка снимка")
+    (magic, version, checksum, row_count,
+     *counts_and_sizes) = HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise SnapshotError("неверная сигнатура снимка")
+    if version not in READABLE_VERSIONS:
+        raise SnapshotError(f"неподдерживаемая версия схемы снимка: {version}")
+    string_counts = counts_and_sizes[:3]
+    blob_sizes = counts_and_sizes[3:]
+
+    view = memoryview(mapping)
+    position = HEADER.size
+
+    def take(typecode, count):
+        nonlocal position
+        size = count * array(typecode).itemsize
+        if position + size > len(mapping):
+            raise SnapshotError("файл снимка обрезан")
+        section = view[position:position + size]
+        position += size + (-size % 8)
+        if typecode == 'B':
+            return section
+        if sys.byteorder != 'little':
+            values = array(typecode, section.tobytes())
+            values.byteswap()
+            return values
+        return section.cast(typecode)
+
+    ids = take('q', row_count) if version >= 2 else None
+    columns = {}
+    for field, typecode in NUMERIC_LAYOUT:
+        columns[field] = take(typecode, row_count)
+    for field in STRING_FIELDS:
+        columns[field] = take('I', row_count)
+    pools = {}
+    for field, count, blob_size in zip(STRING_FIELDS, string_counts, blob_sizes):
+        offsets = take('Q', count + 1)
+        pools[field] = StringPool(MappedStrings(offsets, take('B', blob_size)))
+
+    if position != len(mapping):
+        raise SnapshotError("размер файла не совпадает с заголовком снимка")
+    if verify and zlib.crc32(view[HEADER.size:]) != checksum:
+        raise SnapshotError("контрольная сумма снимка не совпадает")
+
+    return TrackStore.from_columns(columns, pools, row_count, mapping, ids)
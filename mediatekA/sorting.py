@@ -0,0 +1,460 @@
+import os
+from heapq import heapify, heapreplace, merge
+from itertools import islice
+
+import profiling
+from profiling import profiled
+
+
+# Счетчики сортировки при включенном профилировании (см. profiling):
+#   sort.partitions          - разбиения Хоара
+#   sort.key_calls           - вычисления значений ключа (по одному на запись и ключ)
+#   sort.comparisons         - сравнения ключей: при разбиениях (по размерам
+#                              участков), вставками и пирамидальной досортировке
+#   sort.max_depth           - наибольшая глубина разбиений
+#   sort.max_stack           - наибольшая длина явного стека introsort_keys
+#   sort.heapsort_fallbacks  - участки, досортированные пирамидальной сортировкой
+#   sort.heap_replacements   - замены в куче частичного выбора
+
+
+def quicksort(tracks, key_func, descending=False):
+    """
+    Прежняя рекурсивная сортировка Хоара записей по одному ключу.
+    Отчеты ее не используют; оставлена как эталон для бенчмарков.
+    """
+    if len(tracks) <= 1:
+        return tracks.copy()
+
+    pivot = tracks[len(tracks) // 2]
+    pivot_key = key_func(pivot)
+
+    left = []
+    middle = []
+    right = []
+
+    for track in tracks:
+        track_key = key_func(track)
+        if descending:
+            if track_key > pivot_key:
+                left.append(track)
+            elif track_key < pivot_key:
+                right.append(track)
+            else:
+                middle.append(track)
+        else:
+            if track_key < pivot_key:
+                left.append(track)
+            elif track_key > pivot_key:
+                right.append(track)
+            else:
+                middle.append(track)
+
+    return (quicksort(left, key_func, descending) + middle
+            + quicksort(right, key_func, descending))
+
+
+class FieldKey:
+    """
+    Ключ сортировки по полю записи с необязательной нормализацией значения.
+    Для колоночного хранилища значения берутся сразу из колонки.
+    """
+    __slots__ = ('field', 'normalize')
+
+    def __init__(self, field, normalize=None):
+        self.field = field
+        self.normalize = normalize
+
+    def __call__(self, track):
+        if self.normalize is None:
+            return track[self.field]
+        return self.normalize(track[self.field])
+
+
+class _Descending:
+    """Обертка значения ключа с обратным порядком сравнения (для строк по убыванию)"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __le__(self, other):
+        return other.value <= self.value
+
+    def __ge__(self, other):
+        return other.value >= self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f"_Descending({self.value!r})"
+
+
+def _descending(value):
+    """Преобразование значения так, чтобы обычное сравнение давало убывание"""
+    if isinstance(value, (int, float)):
+        return -value
+    return _Descending(value)
+
+
+def make_composite_key(sort_specs):
+    """
+    Функция составного ключа одной записи в виде кортежа.
+    Порядок кортежей совпадает с порядком sort_by_multiple_keys; в отличие от
+    упакованных ключей composite_keys, ключ не зависит от остальных записей,
+    поэтому подходит для двоичного поиска и слияния отсортированных списков.
+    """
+    def composite_key(track):
+        return tuple(_descending(key_func(track)) if reverse else key_func(track)
+                     for key_func, reverse in sort_specs)
+
+    return composite_key
+
+
+def _key_values(tracks, key_func):
+    """Значения ключа для всех записей"""
+    profile = profiling.current
+    if profile is not None:
+        profile.count('sort.key_calls', len(tracks))
+    if isinstance(key_func, FieldKey) and hasattr(tracks, 'column'):
+        return tracks.column(key_func.field, key_func.normalize)
+    return [key_func(track) for track in tracks]
+
+
+def _rank_codes(values, reverse):
+    """
+    Замена значений ключа неотрицательными кодами, сохраняющими порядок.
+    Целые числа кодируются смещением от минимума (максимума при убывании),
+    остальные значения - рангом среди различных значений.
+    Возвращает коды и их основание (верхнюю границу кода).
+    """
+    if not values:
+        return [], 1
+    if all(type(value) is int for value in values):
+        low = min(values)
+        high = max(values)
+        if reverse:
+            return [high - value for value in values], high - low + 1
+        return [value - low for value in values], high - low + 1
+
+    distinct = introsort_keys(list(set(values)))
+    if reverse:
+        distinct.reverse()
+    ranks = {value: rank for rank, value in enumerate(distinct)}
+    return [ranks[value] for value in values], len(distinct)
+
+
+def composite_keys(tracks, sort_specs):
+    """
+    Вычисление упакованных составных ключей для всех записей.
+    Каждый ключ заменяется рангом (для убывания - обратным рангом), ранги
+    упаковываются в одно целое число, а младшие разряды занимает исходная
+    позиция записи: ключи уникальны и сохраняют устойчивость многопроходной
+    сортировки. Позицию записи можно получить как key % len(tracks).
+    """
+    packed = [0] * len(tracks)
+    for key_func, reverse in sort_specs:
+        codes, radix = _rank_codes(_key_values(tracks, key_func), reverse)
+        packed = [value * radix + code for value, code in zip(packed, codes)]
+    count = len(tracks)
+    return [value * count + index for index, value in enumerate(packed)]
+
+
+def hoare_sort_keys(keys):
+    """
+    Сортировка Хоара списка уникальных ключей с разбиением на новые списки.
+    Каждый участок знает свое место в результате, поэтому рекурсия идет
+    только в меньшую часть, а большая обрабатывается в цикле: глубина
+    рекурсии O(log n) на любых входных данных.
+    """
+    result = [None] * len(keys)
+    _hoare_sort_keys(keys, result, 0, profiling.current, 1)
+    return result
+
+
+def _hoare_sort_keys(keys, result, base, profile, depth):
+    """
+    Сортировка keys в result[base:base + len(keys)];
+    profile - активный Profile или None
+    """
+    while len(keys) > 1:
+        pivot = keys[len(keys) // 2]
+        left = []
+        right = []
+
+        for key in keys:
+            if key < pivot:
+                left.append(key)
+            elif key > pivot:
+                right.append(key)
+
+        if profile is not None:
+            # Для ключей из left выполнено одно сравнение, для остальных - два
+            profile.count('sort.partitions')
+            profile.count('sort.comparisons', 2 * len(keys) - len(left))
+            profile.maximum('sort.max_depth', depth)
+
+        pivot_position = base + len(left)
+        result[pivot_position] = pivot
+        if len(left) < len(right):
+            _hoare_sort_keys(left, result, base, profile, depth + 1)
+            keys, base = right, pivot_position + 1
+        else:
+            _hoare_sort_keys(right, result, pivot_position + 1, profile, depth + 1)
+            keys = left
+    if keys:
+        result[base] = keys[0]
+
+
+INSERTION_SORT_THRESHOLD = 16
+NINTHER_THRESHOLD = 128
+
+
+def _insertion_sort(keys, lo, hi):
+    """Сортировка вставками участка keys[lo..hi] на месте; возвращает число сравнений"""
+    comparisons = 0
+    for i in range(lo + 1, hi + 1):
+        key = keys[i]
+        j = i - 1
+        while j >= lo and keys[j] > key:
+            keys[j + 1] = keys[j]
+            j -= 1
+        keys[j + 1] = key
+        # Каждый сдвиг - одно сравнение, плюс остановившее цикл, если j не вышел за lo
+        comparisons += i - 1 - j + (j >= lo)
+    return comparisons
+
+
+def _heapsort(keys, lo, hi):
+    """Пирамидальная сортировка участка keys[lo..hi] на месте; возвращает число сравнений"""
+    count = hi - lo + 1
+    comparisons = 0
+
+    def sift_down(root, end):
+        nonlocal comparisons
+        while True:
+            child = 2 * root + 1
+            if child >= end:
+                return
+            if child + 1 < end:
+                comparisons += 1
+                if keys[lo + child] < keys[lo + child + 1]:
+                    child += 1
+            comparisons += 1
+            if keys[lo + root] >= keys[lo + child]:
+                return
+            keys[lo + root], keys[lo + child] = keys[lo + child], keys[lo + root]
+            root = child
+
+    for start in range(count // 2 - 1, -1, -1):
+        sift_down(start, count)
+    for end in range(count - 1, 0, -1):
+        keys[lo], keys[lo + end] = keys[lo + end], keys[lo]
+        sift_down(0, end)
+    return comparisons
+
+
+def _median_of_three(a, b, c):
+    """Медиана трех значений"""
+    if a < b:
+        if b < c:
+            return b
+        return c if a < c else a
+    if a < c:
+        return a
+    return c if b < c else b
+
+
+def _choose_pivot(keys, lo, hi):
+    """Выбор опорного элемента: медиана трех, для больших участков - медиана девяти"""
+    mid = (lo + hi) // 2
+    if hi - lo < NINTHER_THRESHOLD:
+        return _median_of_three(keys[lo], keys[mid], keys[hi])
+    step = (hi - lo) // 8
+    return _median_of_three(
+        _median_of_three(keys[lo], keys[lo + step], keys[lo + 2 * step]),
+        _median_of_three(keys[mid - step], keys[mid], keys[mid + step]),
+        _median_of_three(keys[hi - 2 * step], keys[hi - step], keys[hi])
+    )
+
+
+def introsort_keys(keys):
+    """
+    Сортировка Хоара списка уникальных ключей на месте (интроспективная).
+    Вместо рекурсии используется явный стек, короткие участки досортировываются
+    вставками, а при превышении допустимой глубины разбиений участок
+    сортируется пирамидальной сортировкой. Дополнительная память - O(log n).
+    """
+    if len(keys) <= 1:
+        return keys
+
+    profile = profiling.current
+    max_depth = 2 * len(keys).bit_length()
+    stack = [(0, len(keys) - 1, 0)]
+    max_stack = 1
+
+    while stack:
+        lo, hi, depth = stack.pop()
+
+        if hi - lo < INSERTION_SORT_THRESHOLD:
+            comparisons = _insertion_sort(keys, lo, hi)
+            if profile is not None:
+                profile.count('sort.comparisons', comparisons)
+            continue
+        if depth > max_depth:
+            comparisons = _heapsort(keys, lo, hi)
+            if profile is not None:
+                profile.count('sort.heapsort_fallbacks')
+                profile.count('sort.comparisons', comparisons)
+            continue
+
+        # Разбиение Хоара
+        pivot = _choose_pivot(keys, lo, hi)
+        i = lo - 1
+        j = hi + 1
+        while True:
+            i += 1
+            while keys[i] < pivot:
+                i += 1
+            j -= 1
+            while keys[j] > pivot:
+                j -= 1
+            if i >= j:
+                break
+            keys[i], keys[j] = keys[j], keys[i]
+
+        if profile is not None:
+            # Указатели проходят участок навстречу друг другу: около одного
+            # сравнения на ключ и по одному на каждом из двух последних шагов
+            profile.count('sort.partitions')
+            profile.count('sort.comparisons', hi - lo + 3)
+            profile.maximum('sort.max_depth', depth + 1)
+
+        # Больший участок кладем в стек первым, чтобы глубина стека была O(log n)
+        if j - lo > hi - j - 1:
+            stack.append((lo, j, depth + 1))
+            stack.append((j + 1, hi, depth + 1))
+        else:
+            stack.append((j + 1, hi, depth + 1))
+            stack.append((lo, j, depth + 1))
+        if len(stack) > max_stack:
+            max_stack = len(stack)
+
+    if profile is not None:
+        profile.maximum('sort.max_stack', max_stack)
+    return keys
+
+
+SORT_ALGORITHMS = {
+    'hoare': hoare_sort_keys,
+    'introsort': introsort_keys,
+}
+
+
+def select_smallest_keys(keys, count):
+    """
+    Частичный выбор: count наименьших уникальных целых ключей по возрастанию.
+    Кандидаты хранятся в куче размера count (ключи с обратным знаком дают
+    кучу максимумов), поэтому выбор стоит O(n log count); выбранные ключи
+    упорядочиваются сортировкой Хоара.
+    """
+    if count <= 0:
+        return []
+    if count >= len(keys):
+        return introsort_keys(list(keys))
+
+    heap = [-key for key in keys[:count]]
+    heapify(heap)
+    replacements = 0
+    for key in islice(keys, count, None):
+        if -key > heap[0]:
+            heapreplace(heap, -key)
+            replacements += 1
+    profile = profiling.current
+    if profile is not None:
+        profile.count('sort.heap_replacements', replacements)
+        profile.count('sort.comparisons', len(keys) - count)
+    return introsort_keys([-key for key in heap])
+
+
+PARALLEL_MIN_KEYS = 100000  # меньше ключей выгоднее сортировать в одном процессе
+
+
+def parallel_sort_keys(keys, algorithm='introsort', workers=None):
+    """
+    Сортировка уникальных ключей в пуле процессов: список делится на равные
+    части по числу процессов, каждая часть сортируется алгоритмом algorithm
+    в своем процессе, отсортированные части сливаются кучей (heapq.merge).
+    Процессам передаются только целые ключи, а не записи. Ключи уникальны,
+    поэтому результат совпадает с последовательной сортировкой.
+    workers=None - по числу ядер.
+    """
+    sort_keys = SORT_ALGORITHMS[algorithm]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(keys) < PARALLEL_MIN_KEYS:
+        return sort_keys(keys)
+    from concurrent.futures import ProcessPoolExecutor  # пул процессов нужен только здесь
+
+    size = -(-len(keys) // workers)
+    chunks = [keys[start:start + size] for start in range(0, len(keys), size)]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        sorted_chunks = list(executor.map(sort_keys, chunks))
+    return list(merge(*sorted_chunks))
+
+
+def check_page(limit, offset):
+    """
+    Проверка страницы результата (общая для всех движков отчетов):
+    offset и limit (если задан) должны быть неотрицательными целыми, иначе ValueError
+    """
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"offset должен быть неотрицательным целым числом: {offset!r}")
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 0):
+        raise ValueError(f"limit должен быть неотрицательным целым числом: {limit!r}")
+
+
+def sort_by_multiple_keys(tracks, sort_specs, algorithm='introsort', limit=None, offset=0,
+                          workers=1):
+    """
+    Сортировка по нескольким ключам
+    sort_specs: список кортежей (ключ_функция, обратный_порядок),
+    первый элемент - самый значимый ключ.
+    algorithm: 'introsort' - на месте с явным стеком, 'hoare' - разбиение
+    на новые списки с рекурсией только в меньшую часть.
+    limit, offset: нужна только страница результата; при заданном limit
+    вместо полной сортировки выполняется частичный выбор offset + limit ключей.
+    workers: число процессов полной сортировки (None - по числу ядер),
+    см. parallel_sort_keys; по умолчанию сортировка в текущем процессе.
+    Ключи вычисляются один раз на запись, сортировка выполняется одним проходом Хоара.
+    """
+    return [tracks[position]
+            for position in sorted_positions(tracks, sort_specs, algorithm, limit, offset,
+                                              workers)]
+
+
+@profiled('sort')
+def sorted_positions(tracks, sort_specs, algorithm='introsort', limit=None, offset=0,
+                     workers=1):
+    """Позиции записей tracks в порядке сортировки по нескольким ключам"""
+    check_page(limit, offset)
+    if not tracks:
+        return []
+    if algorithm not in SORT_ALGORITHMS:
+        raise ValueError(f"Неизвестный алгоритм сортировки: {algorithm}")
+
+    count = len(tracks)
+    keys = composite_keys(tracks, sort_specs)
+    if limit is None:
+        keys = parallel_sort_keys(keys, algorithm, workers)
+    else:
+        keys = select_smallest_keys(keys, offset + limit)
+    return [key % count for key in keys[offset:]]
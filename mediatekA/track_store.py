@@ -0,0 +1,589 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from itertools import count
+
+FIELDS = ('artist', 'title', 'album', 'year', 'duration', 'plays')
+STRING_FIELDS = ('artist', 'title', 'album')
+# Типы колонок array: 'i' - 4 байта, 'q' - 8 байт (прослушиваний до 10^12)
+NUMERIC_FIELDS = {'year': 'i', 'duration': 'i', 'plays': 'q'}
+
+# Общий счетчик версий: каждое хранилище и каждое изменение получают новый номер
+_generations = count(1)
+# Пакет изменений больше этой доли записей (и не меньше REBUILD_MIN_BATCH записей)
+# не обновляет производные структуры по записи: они сбрасываются и строятся заново
+REBUILD_BATCH_FRACTION = 0.1
+REBUILD_MIN_BATCH = 1000
+COMPACT_MIN_DELETED = 10000  # минимум удаленных строк для автоматического сжатия
+
+
+def collation_key(value):
+    """
+    Ключ сравнения строк без учета регистра (полное свертывание регистра Unicode:
+    'ß' и 'SS', 'Σ' и 'ς' сравниваются как равные).
+    """
+    return value.casefold()
+
+
+class StringPool:
+    """
+    Словарь строк колонки: каждая различная строка хранится один раз.
+    keys - ключи сравнения collation_key строк по тем же номерам; вычисляются
+    один раз при добавлении строки и используются всеми отчетами.
+    """
+
+    def __init__(self, strings=None):
+        if strings is None:
+            self.strings = []
+            self.ids = {}
+            self.keys = []
+        else:
+            # Строки только для чтения (например, из снимка): словарь номеров
+            # и ключи сравнения строятся позже
+            self.strings = strings
+            self.ids = None
+            self.keys = None
+
+    def make_writable(self):
+        """Перевод словаря строк только для чтения в изменяемый"""
+        if self.ids is None:
+            self.collation_keys()
+            self.strings = list(self.strings)
+            self.ids = {string: string_id for string_id, string in enumerate(self.strings)}
+
+    def collation_keys(self):
+        """Ключи сравнения строк словаря по номерам строк"""
+        if self.keys is None:
+            self.keys = [collation_key(string) for string in self.strings]
+        return self.keys
+
+    def intern(self, value):
+        """Получение номера строки с добавлением новой строки в словарь"""
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self.keys.append(collation_key(value))
+            self.ids[value] = string_id
+        return string_id
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class TrackRow(MutableMapping):
+    """
+    Представление одной записи хранилища, ведущее себя как словарь трека.
+    Чтение и запись полей обращаются напрямую к колонкам хранилища.
+    """
+    __slots__ = ('store', 'row_id')
+
+    def __init__(self, store, row_id):
+        self.store = store
+        self.row_id = row_id
+
+    def __getitem__(self, field):
+        return self.store.get_value(self.row_id, field)
+
+    def __setitem__(self, field, value):
+        self.store.set_value(self.row_id, field, value)
+
+    def __delitem__(self, field):
+        raise TypeError("Поля записи нельзя удалять")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    @property
+    def track_id(self):
+        return self.store.ids[self.row_id]
+
+    def to_dict(self):
+        """Копия записи в виде обычного словаря"""
+        return {field: self[field] for field in FIELDS}
+
+    def __repr__(self):
+        return f"TrackRow({self.row_id}, {self.to_dict()!r})"
+
+
+class StoreListener:
+    """
+    Производная структура, которую хранилище уведомляет об изменениях.
+    row_ids в уведомлениях упорядочены по возрастанию; порядок номеров строк
+    совпадает с порядком записей в хранилище.
+    """
+
+    def rows_added(self, store, row_ids):
+        """Записи добавлены"""
+
+    def rows_removed(self, store, row_ids):
+        """Записи удалены (значения полей еще доступны через store.get_value)"""
+
+    def rows_changed(self, store, changes):
+        """Поля изменены: changes - список (row_id, поле, старое значение)"""
+
+
+class TrackView:
+    """Упорядоченная выборка записей хранилища по номерам строк"""
+
+    def __init__(self, store, row_ids):
+        self.store = store
+        self.row_ids = row_ids
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return TrackView(self.store, self.row_ids[position])
+        return TrackRow(self.store, self.row_ids[position])
+
+    def __iter__(self):
+        store = self.store
+        for row_id in self.row_ids:
+            yield TrackRow(store, row_id)
+
+    def copy(self):
+        return list(self)
+
+    def column(self, field, normalize=None):
+        """Значения поля для записей выборки (с необязательной нормализацией)"""
+        return self.store.column(field, normalize, self.row_ids)
+
+    def select(self, field, predicate):
+        """Выборка записей, у которых значение поля удовлетворяет условию"""
+        return self.store.select(field, predicate, self.row_ids)
+
+    def iter_values(self):
+        """Кортежи значений полей записей выборки по порядку"""
+        return self.store.iter_values(self.row_ids)
+
+
+class TrackStore(TrackView):
+    """
+    Колоночное хранилище медиатеки.
+    Числовые поля хранятся в типизированных массивах array, строковые -
+    номерами в словарях строк. Номер строки (row_id) записи не меняется
+    до сжатия (compact): удаление только помечает строку и убирает ее из порядка
+    записей row_ids, по которому работают позиции 1..N в меню.
+    ids - постоянные идентификаторы записей: не меняются ни при удалении
+    других записей, ни при сжатии, выдаются по возрастанию в порядке
+    добавления (поэтому колонка ids отсортирована и поиск по ней двоичный).
+    Идентификаторы сохраняются в файле медиатеки и в снимке и при загрузке
+    восстанавливаются; новые выдаются после наибольшего загруженного.
+    generation - номер версии данных, меняется при каждом изменении.
+    """
+
+    def __init__(self, tracks=()):
+        self.pools = {field: StringPool() for field in STRING_FIELDS}
+        self.columns = {field: array('I') for field in STRING_FIELDS}
+        for field, typecode in NUMERIC_FIELDS.items():
+            self.columns[field] = array(typecode)
+        self.deleted = bytearray()
+        self.ids = array('q')
+        self.last_id = 0
+        self.listeners = []
+        self.derived = {}
+        self.generation = next(_generations)
+        self.read_only = False
+        self.mapping = None
+        super().__init__(self, array('q'))
+        self.extend(tracks)
+
+    @classmethod
+    def from_columns(cls, columns, pools, row_count, mapping=None, ids=None):
+        """
+        Хранилище поверх готовых колонок без копирования (например, memoryview
+        отображенного в память снимка). Такое хранилище копирует колонки
+        в изменяемые массивы только при первом изменении.
+        ids - возрастающие идентификаторы записей (по умолчанию 1..row_count).
+        """
+        store = cls()
+        store.columns = columns
+        store.pools = pools
+        store.deleted = bytearray(row_count)
+        store.ids = range(1, row_count + 1) if ids is None else ids
+        store.last_id = store.ids[-1] if row_count else 0
+        store.row_ids = range(row_count)
+        store.read_only = True
+        store.mapping = mapping
+        return store
+
+    def _make_writable(self):
+        """Копирование колонок только для чтения в изменяемые массивы"""
+        for field, column in self.columns.items():
+            if not isinstance(column, array):
+                writable = array(column.format)
+                writable.frombytes(column.cast('B'))
+                self.columns[field] = writable
+        for pool in self.pools.values():
+            pool.make_writable()
+        self.row_ids = array('q', self.row_ids)
+        self.ids = array('q', self.ids)
+        self.read_only = False
+        self.mapping = None
+
+    # Производные структуры (индексы и т.п.)
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def get_derived(self, name, factory):
+        """
+        Производная структура name, построенная factory(store) при первом обращении.
+        Если структура является слушателем, она подписывается на изменения.
+        """
+        structure = self.derived.get(name)
+        if structure is None:
+            structure = factory(self)
+            self.derived[name] = structure
+            if isinstance(structure, StoreListener):
+                self.add_listener(structure)
+        return structure
+
+    def reset_derived(self):
+        """Сброс производных структур: они будут построены заново при обращении"""
+        for structure in self.derived.values():
+            if structure in self.listeners:
+                self.remove_listener(structure)
+        self.derived.clear()
+
+    def _next_ids(self, count, track_ids=None):
+        """
+        Постоянные идентификаторы для count новых записей.
+        track_ids - сохраненные идентификаторы записей (например, из файла);
+        сохраненный идентификатор используется, если он больше всех выданных,
+        иначе (None, 0, повтор) записи выдается новый.
+        """
+        if track_ids is None:
+            first = self.last_id + 1
+            self.last_id += count
+            return range(first, first + count)
+        ids = array('q')
+        last_id = self.last_id
+        for track_id in track_ids:
+            last_id = track_id if track_id is not None and track_id > last_id else last_id + 1
+            ids.append(last_id)
+        self.last_id = last_id
+        return ids
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            getattr(listener, event)(self, *args)
+
+    def _notify_batch(self, event, items):
+        """
+        Одно уведомление о пакете изменений. Для большого пакета производные
+        структуры сбрасываются: построить их заново дешевле, чем обновлять
+        по одной записи.
+        """
+        if len(items) >= max(REBUILD_MIN_BATCH, len(self.row_ids) * REBUILD_BATCH_FRACTION):
+            self.reset_derived()
+        if self.listeners:
+            self._notify(event, items)
+
+    # Добавление и удаление
+    def append_values(self, artist, title, album, year, duration, plays, track_id=None):
+        """
+        Добавление записи по значениям полей, возвращает row_id.
+        track_id - сохраненный идентификатор записи (см. _next_ids).
+        """
+        if self.read_only:
+            self._make_writable()
+        columns = self.columns
+        pools = self.pools
+        row_id = len(self.deleted)
+        columns['artist'].append(pools['artist'].intern(artist))
+        columns['title'].append(pools['title'].intern(title))
+        columns['album'].append(pools['album'].intern(album))
+        columns['year'].append(year)
+        columns['duration'].append(duration)
+        columns['plays'].append(plays)
+        self.deleted.append(0)
+        self.ids.extend(self._next_ids(1, (track_id,)))
+        self.row_ids.append(row_id)
+        self.generation = next(_generations)
+        if self.listeners:
+            self._notify('rows_added', [row_id])
+        return row_id
+
+    def append(self, track):
+        """Добавление записи из словаря трека (с необязательным ключом 'track_id')"""
+        return self.append_values(track['artist'], track['title'], track['album'],
+                                  track['year'], track['duration'], track['plays'],
+                                  track.get('track_id'))
+
+    def extend(self, tracks):
+        """
+        Добавление пакета записей из словарей одним изменением (одно уведомление).
+        Колонки пакета собираются отдельно и присоединяются, только если все
+        значения подходят по типу. Сохраненные идентификаторы берутся из
+        необязательного ключа 'track_id'. Возвращает диапазон номеров добавленных строк.
+        """
+        if self.read_only:
+            self._make_writable()
+        interns = [(field, self.pools[field].intern) for field in STRING_FIELDS]
+        values = {field: [] for field in FIELDS}
+        track_ids = []
+        for track in tracks:
+            for field, intern in interns:
+                values[field].append(intern(track[field]))
+            for field in NUMERIC_FIELDS:
+                values[field].append(track[field])
+            track_ids.append(track.get('track_id'))
+        batch = {field: array(self.columns[field].typecode, values[field]) for field in FIELDS}
+        if not len(batch['year']):
+            return range(len(self.deleted), len(self.deleted))
+
+        first_row = len(self.deleted)
+        for field in FIELDS:
+            self.columns[field].extend(batch[field])
+        self.deleted.extend(bytes(len(batch['year'])))
+        self.ids.extend(self._next_ids(len(track_ids), track_ids))
+        added = range(first_row, len(self.deleted))
+        self.row_ids.extend(added)
+        self.generation = next(_generations)
+        self._notify_batch('rows_added', list(added))
+        return added
+
+    def append_encoded(self, strings, artists, titles, albums, years, durations, plays,
+                       track_ids=None):
+        """
+        Добавление блока записей, закодированных вне хранилища.
+        strings - локальный словарь строк блока, artists/titles/albums - номера
+        строк в нем, years/durations/plays - значения числовых колонок,
+        track_ids - сохраненные идентификаторы (0 - выдать новый, см. _next_ids).
+        Возвращает диапазон номеров добавленных строк.
+        """
+        if self.read_only:
+            self._make_writable()
+        pools = self.pools
+        columns = self.columns
+        first_row = len(self.deleted)
+        for field, local_ids in (('artist', artists), ('title', titles), ('album', albums)):
+            pool = pools[field]
+            remap = {}
+            for local_id in set(local_ids):
+                remap[local_id] = pool.intern(strings[local_id])
+            columns[field].extend(array('I', [remap[local_id] for local_id in local_ids]))
+        columns['year'].extend(years)
+        columns['duration'].extend(durations)
+        columns['plays'].extend(plays)
+        self.deleted.extend(bytes(len(years)))
+        self.ids.extend(self._next_ids(len(years), track_ids))
+        added = range(first_row, len(self.deleted))
+        self.row_ids.extend(added)
+        self.generation = next(_generations)
+        if self.listeners:
+            self._notify('rows_added', list(added))
+        return added
+
+    def pop(self, position=-1):
+        """Удаление записи по позиции, возвращает копию удаленной записи"""
+        if self.read_only:
+            self._make_writable()
+        row_id = self.row_ids.pop(position)
+        self.deleted[row_id] = 1
+        self.generation = next(_generations)
+        if self.listeners:
+            self._notify('rows_removed', [row_id])
+        return TrackRow(self, row_id).to_dict()
+
+    def position_of(self, row_id):
+        """Позиция записи по номеру строки (номера строк в row_ids возрастают)"""
+        position = bisect_left(self.row_ids, row_id)
+        if position == len(self.row_ids) or self.row_ids[position] != row_id:
+            raise KeyError(row_id)
+        return position
+
+    def remove_row(self, row_id):
+        """Удаление записи по номеру строки"""
+        return self.pop(self.position_of(row_id))
+
+    def remove_rows(self, row_ids):
+        """
+        Удаление пакета записей по номерам строк за один проход по порядку записей
+        (вместо сдвига row_ids при каждом удалении) и одно уведомление.
+        Когда удаленных строк становится больше, чем записей, хранилище сжимается.
+        Возвращает число удаленных записей.
+        """
+        row_ids = sorted(set(row_ids))
+        for row_id in row_ids:
+            if not 0 <= row_id < len(self.deleted) or self.deleted[row_id]:
+                raise KeyError(row_id)
+        if not row_ids:
+            return 0
+        if self.read_only:
+            self._make_writable()
+        deleted = self.deleted
+        for row_id in row_ids:
+            deleted[row_id] = 1
+        self.row_ids = array('q', [row_id for row_id in self.row_ids if not deleted[row_id]])
+        self.generation = next(_generations)
+        self._notify_batch('rows_removed', row_ids)
+        if len(deleted) - len(self.row_ids) > max(COMPACT_MIN_DELETED, len(self.row_ids)):
+            self.compact()
+        return len(row_ids)
+
+    def compact(self):
+        """
+        Сжатие: удаленные строки убираются из колонок, записи получают номера
+        строк 0..N-1 в прежнем порядке. Производные структуры сбрасываются,
+        так как хранят номера строк; слушатели, работающие с позициями записей
+        (журнал), остаются верными - позиции не меняются.
+        """
+        if len(self.row_ids) == len(self.deleted):
+            return
+        if self.read_only:
+            self._make_writable()
+        live = self.row_ids
+        for field, column in self.columns.items():
+            self.columns[field] = array(column.typecode, [column[row_id] for row_id in live])
+        self.ids = array('q', [self.ids[row_id] for row_id in live])
+        self.deleted = bytearray(len(live))
+        self.row_ids = array('q', range(len(live)))
+        self.reset_derived()
+        self.generation = next(_generations)
+
+    def row_of(self, track_id):
+        """Номер строки записи по постоянному идентификатору"""
+        row_id = bisect_left(self.ids, track_id)
+        if row_id == len(self.ids) or self.ids[row_id] != track_id or self.deleted[row_id]:
+            raise KeyError(track_id)
+        return row_id
+
+    # Доступ к значениям
+    def row(self, row_id):
+        return TrackRow(self, row_id)
+
+    def get_value(self, row_id, field):
+        if field in self.pools:
+            return self.pools[field].strings[self.columns[field][row_id]]
+        return self.columns[field][row_id]
+
+    def set_value(self, row_id, field, value):
+        if field not in self.columns:
+            raise KeyError(field)
+        old_value = self.get_value(row_id, field)
+        if old_value == value:
+            return
+        if self.read_only:
+            self._make_writable()
+        if field in self.pools:
+            self.columns[field][row_id] = self.pools[field].intern(value)
+        else:
+            self.columns[field][row_id] = value
+        self.generation = next(_generations)
+        if self.listeners:
+            self._notify('rows_changed', [(row_id, field, old_value)])
+
+    def set_values(self, updates):
+        """
+        Пакет изменений полей [(row_id, поле, значение)] с одним уведомлением.
+        Возвращает число действительно измененных значений.
+        """
+        updates = list(updates)
+        for row_id, field, _ in updates:
+            if field not in self.columns:
+                raise KeyError(field)
+            if not 0 <= row_id < len(self.deleted) or self.deleted[row_id]:
+                raise KeyError(row_id)
+        changes = []
+        try:
+            for row_id, field, value in updates:
+                old_value = self.get_value(row_id, field)
+                if old_value == value:
+                    continue
+                if self.read_only:
+                    self._make_writable()
+                if field in self.pools:
+                    self.columns[field][row_id] = self.pools[field].intern(value)
+                else:
+                    self.columns[field][row_id] = value
+                changes.append((row_id, field, old_value))
+        finally:
+            # Уже выполненные изменения сообщаются и при ошибке в середине пакета
+            if changes:
+                self.generation = next(_generations)
+                self._notify_batch('rows_changed', changes)
+        return len(changes)
+
+    def iter_values(self, row_ids=None):
+        """
+        Кортежи значений записей row_ids (по умолчанию - всех в порядке хранения)
+        для быстрой выгрузки и вывода.
+        """
+        if row_ids is None:
+            row_ids = self.row_ids
+        artists = self.pools['artist'].strings
+        titles = self.pools['title'].strings
+        albums = self.pools['album'].strings
+        columns = self.columns
+        for row_id in row_ids:
+            yield (artists[columns['artist'][row_id]], titles[columns['title'][row_id]],
+                   albums[columns['album'][row_id]], columns['year'][row_id],
+                   columns['duration'][row_id], columns['plays'][row_id])
+
+    def column(self, field, normalize=None, row_ids=None):
+        """
+        Значения поля для строк row_ids (по умолчанию - всех записей по порядку).
+        Для строковых полей ключи сравнения collation_key берутся из словаря строк,
+        другая нормализация применяется один раз к каждой различной строке,
+        если выборка не меньше словаря строк.
+        """
+        if row_ids is None:
+            row_ids = self.row_ids
+        values = self.columns[field]
+        if field not in self.pools:
+            return [values[row_id] for row_id in row_ids]
+
+        strings = self.pools[field].strings
+        if normalize is None:
+            return [strings[values[row_id]] for row_id in row_ids]
+        if normalize is collation_key:
+            keys = self.pools[field].collation_keys()
+            return [keys[values[row_id]] for row_id in row_ids]
+        if len(row_ids) < len(strings):
+            return [normalize(strings[values[row_id]]) for row_id in row_ids]
+        table = [normalize(string) for string in strings]
+        return [table[values[row_id]] for row_id in row_ids]
+
+    def select(self, field, predicate, row_ids=None):
+        """
+        Выборка записей, у которых значение поля удовлетворяет условию.
+        Для строковых полей условие проверяется один раз для каждой различной строки.
+        """
+        if row_ids is None:
+            row_ids = self.row_ids
+        values = self.columns[field]
+        if field in self.pools:
+            matched = {string_id for string_id, string in enumerate(self.pools[field].strings)
+                       if predicate(string)}
+            selected = [row_id for row_id in row_ids if values[row_id] in matched]
+        else:
+            selected = [row_id for row_id in row_ids if predicate(values[row_id])]
+        return TrackView(self, array('q', selected))
+
+
+def changed_rows(store, changes):
+    """
+    Группировка изменений по записям.
+    Возвращает список (row_id, запись до изменений, запись после) в виде словарей.
+    """
+    grouped = {}
+    for row_id, field, old_value in changes:
+        entry = grouped.get(row_id)
+        if entry is None:
+            new_track = store.row(row_id).to_dict()
+            entry = grouped[row_id] = (dict(new_track), new_track, set())
+        old_track, _, seen = entry
+        if field not in seen:
+            old_track[field] = old_value
+            seen.add(field)
+    return [(row_id, old_track, new_track)
+            for row_id, (old_track, new_track, _) in grouped.items()]
@@ -0,0 +1,72 @@
+from track_store import FIELDS, NUMERIC_FIELDS
+
+# Правила проверки по полям: (условие ошибки, сообщение).
+# Для каждого поля выводится только первая найденная ошибка.
+RULES = {
+    'artist': [(lambda value: not value or not value.strip(), "Исполнитель не может быть пустым")],
+    'title': [(lambda value: not value or not value.strip(), "Название трека не может быть пустым")],
+    'album': [(lambda value: not value or not value.strip(), "Альбом не может быть пустым")],
+    'year': [(lambda value: value < 1900 or value > 2026, "Год должен быть в диапазоне 1900-2026")],
+    'duration': [
+        (lambda value: value <= 0, "Длительность должна быть положительным числом"),
+        (lambda value: value > 3600, "Длительность не должна превышать 3600 секунд (1 час)"),
+    ],
+    'plays': [
+        (lambda value: value < 0, "Количество прослушиваний не может быть отрицательным"),
+        (lambda value: value > 1000000000000, "Количество прослушиваний слишком велико"),
+    ],
+}
+MAX_REPORTED_ERRORS = 10  # сколько некорректных записей перечислять в сообщении
+
+
+def validate_track_data(artist, title, album, year, duration, plays):
+    """Проверка корректности числовых данных"""
+    errors = []
+    for field, value in zip(FIELDS, (artist, title, album, year, duration, plays)):
+        for is_invalid, message in RULES[field]:
+            if is_invalid(value):
+                errors.append(message)
+                break
+    return errors
+
+
+def _has_type(field, value):
+    if field in NUMERIC_FIELDS:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, str)
+
+
+def validate_tracks(tracks):
+    """
+    Проверка пакета записей по колонкам: каждое правило применяется ко всей
+    колонке значений сразу, а не к записи за записью.
+    Возвращает список (номер записи в пакете, список ошибок) некорректных записей.
+    """
+    errors = {}
+    for field in FIELDS:
+        column = [track.get(field) for track in tracks]
+        # Значения неверного типа не проверяются остальными правилами поля
+        checked = []
+        for position, value in enumerate(column):
+            if _has_type(field, value):
+                checked.append(position)
+            else:
+                errors.setdefault(position, []).append(
+                    f"Поле {field} должно быть {'целым числом' if field in NUMERIC_FIELDS else 'строкой'}")
+        for is_invalid, message in RULES[field]:
+            failed = [position for position in checked if is_invalid(column[position])]
+            if failed:
+                for position in failed:
+                    errors.setdefault(position, []).append(message)
+                failed = set(failed)
+                checked = [position for position in checked if position not in failed]
+    return sorted(errors.items())
+
+
+def describe_errors(errors, first_number=1):
+    """Текст ошибок проверки пакета: первые MAX_REPORTED_ERRORS записей и общее число"""
+    lines = [f"запись {position + first_number}: {'; '.join(messages)}"
+             for position, messages in errors[:MAX_REPORTED_ERRORS]]
+    if len(errors) > MAX_REPORTED_ERRORS:
+        lines.append(f"... всего некорректных записей: {len(errors)}")
+    return "\n".join(lines)
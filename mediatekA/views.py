@@ -0,0 +1,186 @@
+from array import array
+from collections import OrderedDict
+from heapq import merge
+from itertools import islice
+
+from sorting import FieldKey, make_composite_key, sorted_positions
+from track_store import StoreListener, TrackView, changed_rows
+
+MAX_GROUP_VIEWS = 256
+
+
+class SortedView:
+    """
+    Материализованный отсортированный список записей.
+    Хранит только номера строк (array('q')) в порядке составного ключа;
+    ключи записей при двоичном поиске вычисляются по колонкам хранилища.
+    Номер строки замыкает ключ: номера строк возрастают в порядке хранения,
+    поэтому равные ключи упорядочены так же, как при устойчивой сортировке.
+    """
+
+    def __init__(self, tracks, sort_specs):
+        self.store = tracks.store
+        self.key_func = make_composite_key(sort_specs)
+        row_ids = tracks.row_ids
+        self.rows = array('q', [row_ids[position]
+                                for position in sorted_positions(tracks, sort_specs)])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def key(self, row_id, track=None):
+        """Составной ключ записи; track - ее значения, если они отличаются от хранилища"""
+        if track is None:
+            track = self.store.row(row_id)
+        return self.key_func(track) + (row_id,)
+
+    def _position(self, key, old_tracks):
+        """
+        Первая позиция, ключ записи на которой не меньше key.
+        old_tracks: номер строки -> прежние значения записей, которые уже
+        изменены в хранилище, но еще стоят на старом месте представления.
+        """
+        rows = self.rows
+        lo = 0
+        hi = len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row_id = rows[mid]
+            if self.key(row_id, old_tracks.get(row_id)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def insert(self, row_id, track):
+        self.rows.insert(self._position(self.key(row_id, track), {}), row_id)
+
+    def remove(self, row_id, track, old_tracks=None):
+        position = self._position(self.key(row_id, track), old_tracks or {})
+        if position < len(self.rows) and self.rows[position] == row_id:
+            del self.rows[position]
+
+    def row_ids(self, limit=None, offset=0):
+        return self.rows[offset:None if limit is None else offset + limit]
+
+
+def sorted_rows(tracks, sort_specs, limit=None, offset=0):
+    """Записи выборки хранилища в порядке сортировки (страница offset/limit)"""
+    positions = sorted_positions(tracks, sort_specs, limit=limit, offset=offset)
+    row_ids = tracks.row_ids
+    return TrackView(tracks.store, array('q', [row_ids[position] for position in positions]))
+
+
+# Общее представление групп без записей: такие группы не кешируются
+EMPTY_VIEW = SortedView(TrackView(None, array('q')), [])
+
+
+class GroupedViews(StoreListener):
+    """
+    Отсортированные представления для групп записей (например, по исполнителю).
+    Представление группы строится при первом запросе и затем обновляется
+    вставкой и удалением двоичным поиском при изменениях хранилища.
+    Хранится не более max_views представлений, давно не запрошенные
+    вытесняются; для групп без записей возвращается общее EMPTY_VIEW.
+    group_func(track) - группа записи, group_rows(store, group) - записи группы.
+    """
+
+    def __init__(self, store, sort_specs, group_func, group_rows, max_views=MAX_GROUP_VIEWS):
+        self.sort_specs = sort_specs
+        self.group_func = group_func
+        self.group_rows = group_rows
+        self.max_views = max_views
+        self.views = OrderedDict()
+        if all(isinstance(key_func, FieldKey) for key_func, _ in sort_specs):
+            self.fields = {key_func.field for key_func, _ in sort_specs}
+        else:
+            self.fields = None
+
+    def view(self, store, group):
+        view = self.views.get(group)
+        if view is not None:
+            self.views.move_to_end(group)
+            return view
+        tracks = self.group_rows(store, group)
+        if not len(tracks):
+            return EMPTY_VIEW
+        view = self.views[group] = SortedView(tracks, self.sort_specs)
+        if len(self.views) > self.max_views:
+            self.views.popitem(last=False)
+        return view
+
+    def has_view(self, group):
+        return group in self.views
+
+    def rows(self, store, group, limit=None, offset=0):
+        """
+        Записи группы в порядке сортировки (страница offset/limit).
+        Если представление группы еще не построено, а нужна только страница,
+        она выбирается частичным выбором без сортировки всей группы.
+        """
+        if limit is not None and group not in self.views:
+            return sorted_rows(self.group_rows(store, group), self.sort_specs, limit, offset)
+        return TrackView(store, self.view(store, group).row_ids(limit, offset))
+
+    def rows_added(self, store, row_ids):
+        for row_id in row_ids:
+            track = store.row(row_id).to_dict()
+            view = self.views.get(self.group_func(track))
+            if view is not None:
+                view.insert(row_id, track)
+
+    def rows_removed(self, store, row_ids):
+        for row_id in row_ids:
+            track = store.row(row_id).to_dict()
+            view = self.views.get(self.group_func(track))
+            if view is not None:
+                view.remove(row_id, track)
+
+    def rows_changed(self, store, changes):
+        # Сначала все измененные записи удаляются со старых мест (их соседи
+        # по представлению сравниваются по прежним значениям), затем
+        # вставляются по новым
+        moved = []
+        old_tracks = {}
+        for row_id, old_track, new_track in changed_rows(store, changes):
+            old_group = self.group_func(old_track)
+            new_group = self.group_func(new_track)
+            if old_group == new_group and self.fields is not None and not any(
+                    old_track[field] != new_track[field] for field in self.fields):
+                continue
+            moved.append((row_id, old_track, new_track, old_group, new_group))
+            old_tracks[row_id] = old_track
+        for row_id, old_track, _, old_group, _ in moved:
+            view = self.views.get(old_group)
+            if view is not None:
+                view.remove(row_id, old_track, old_tracks)
+        for row_id, _, new_track, _, new_group in moved:
+            view = self.views.get(new_group)
+            if view is not None:
+                view.insert(row_id, new_track)
+
+    def check_consistency(self, store):
+        """Группы, чьи представления расходятся с новой сортировкой"""
+        mismatched = []
+        for group, view in self.views.items():
+            tracks = self.group_rows(store, group)
+            expected = [tracks.row_ids[position]
+                        for position in sorted_positions(tracks, self.sort_specs)]
+            if list(view.row_ids()) != expected:
+                mismatched.append(group)
+        return mismatched
+
+
+def merge_views(store, views, limit=None, offset=0):
+    """
+    Слияние нескольких отсортированных представлений в одно упорядочение.
+    При заданном limit слияние останавливается после нужной страницы.
+    """
+    views = [view for view in views if len(view)]
+    if not views:
+        return TrackView(store, array('q'))
+    if len(views) == 1:
+        return TrackView(store, views[0].row_ids(limit, offset))
+    rows = merge(*(view.rows for view in views), key=views[0].key)
+    return TrackView(store, array('q', islice(rows, offset,
+                                              None if limit is None else offset + limit)))